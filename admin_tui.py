@@ -1,11 +1,13 @@
-from typing import Callable
+from typing import Callable, Optional
 from rich.console import Console
-from kb import last, search, add_entry
+from kb import last, search, add_entry, query
 from ui_texts import load_texts
 
+QUERY_FILTERS = {"kind", "role", "topic", "sender", "since", "until", "limit"}
+
 
 def main(
-    route: Callable[[str, str, str], None],
+    route: Callable[[str, str, str], Optional[str]],
     check_ceo: Callable[[str], str],
     lang: str = "en",
 ):
@@ -21,7 +23,9 @@ def main(
         if line.startswith("chat "):
             _, rest = line.split(" ", 1)
             agent, msg = rest.split("::", 1)
-            route("admin", agent.strip(), msg.strip())
+            status = route("admin", agent.strip(), msg.strip())
+            if status not in (None, "ok"):
+                console.print(f"bus: {status}")
         elif line.startswith("check "):
             _, rest = line.split(" ", 1)
             agent, msg = rest.split("::", 1)
@@ -34,8 +38,18 @@ def main(
             for entry in last(n):
                 console.print(entry)
         elif line.startswith("kb search"):
-            _, query = line.split("::", 1)
-            for entry in search(query.strip()):
+            _, q = line.split("::", 1)
+            for entry in search(q.strip(), limit=20):
+                console.print({k: entry[k] for k in ("id", "kind", "ts", "snippet")})
+        elif line.startswith("kb query"):
+            _, rest = line.split("::", 1)
+            filters = dict(part.split("=", 1) for part in rest.split() if "=" in part)
+            unknown = sorted(set(filters) - QUERY_FILTERS)
+            if unknown:
+                console.print(f"unknown filter: {', '.join(unknown)}")
+                continue
+            limit = int(filters.pop("limit", 20))
+            for entry in query(limit=limit, **filters):
                 console.print(entry)
         elif line.startswith("kb memo"):
             _, rest = line.split("::", 1)
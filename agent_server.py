@@ -17,7 +17,7 @@ import yaml
 import json
 
 from models.backend import make_client
-from kb import add_entry
+from kb import aadd_entry, add_entry
 from bus_client import BusClient
 from profile.points import award_points, get_rankings
 from profile.badges import assign_badge
@@ -50,7 +50,7 @@ async def auth_middleware(request: Request, call_next):
     if SHARED_SECRET:
         auth = request.headers.get("Authorization")
         if auth != f"Bearer {SHARED_SECRET}":
-            add_entry(kind="auth_failure", role=role, path=str(request.url))
+            await aadd_entry(kind="auth_failure", role=role, path=str(request.url))
             return JSONResponse({"detail": "Unauthorized"}, status_code=401)
     return await call_next(request)
 
@@ -83,7 +83,9 @@ class BadgeRequest(BaseModel):
 async def startup_event():
     if BUS_URL:
         global subscriber
-        subscriber = BusClient(BUS_URL, role, handle_bus_message, token=BUS_TOKEN)
+        # Leased long-polls are at-least-once; SSE streaming (BUS_STREAM=1) is not.
+        stream = os.environ.get("BUS_STREAM", "0") == "1"
+        subscriber = BusClient(BUS_URL, role, handle_bus_message, token=BUS_TOKEN, stream=stream)
         threading.Thread(target=subscriber.run, daemon=True).start()
     init_cron()
 
@@ -102,7 +104,7 @@ async def chat(req: ChatRequest):
     history.append({"role": "user", "content": req.message})
     reply = client.chat(history)
     history.append({"role": "assistant", "content": reply})
-    add_entry(kind="chat", role=role, sender=req.sender, message=req.message, reply=reply)
+    await aadd_entry(kind="chat", role=role, sender=req.sender, message=req.message, reply=reply)
     if req.sender:
         award_points(req.sender, "chat")
     return {"reply": reply}
@@ -110,13 +112,13 @@ async def chat(req: ChatRequest):
 
 @app.post("/wake")
 async def wake():
-    add_entry(kind="wake", role=role)
+    await aadd_entry(kind="wake", role=role)
     return {"status": "awake"}
 
 
 @app.post("/handoff")
 async def handoff(req: ChatRequest):
-    add_entry(kind="handoff", role=role, data=req.message)
+    await aadd_entry(kind="handoff", role=role, data=req.message)
     return {"status": "ok"}
 
 
@@ -124,7 +126,7 @@ async def handoff(req: ChatRequest):
 async def publish(req: ChatRequest):
     if subscriber:
         await subscriber.publish(role, req.message)
-    add_entry(kind="publish", role=role, data=req.message)
+    await aadd_entry(kind="publish", role=role, data=req.message)
     return {"status": "published"}
 
 
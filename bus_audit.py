@@ -0,0 +1,117 @@
+"""Background audit sink for bus traffic.
+
+``bus_server`` records every published message here instead of writing to
+the knowledge base inline. :class:`AuditSink` applies a per-topic policy
+and buffers the rows. A daemon thread writes them in batches every
+``interval_ms`` milliseconds, or as soon as ``max_batch`` rows are waiting.
+
+Policies are ``full`` (every message), ``drop`` (none) and ``sample:<rate>``
+(a random fraction, e.g. ``sample:0.1``).
+"""
+
+import random
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+def parse_policies(spec: str) -> Dict[str, str]:
+    """``"metrics=sample:0.1,heartbeat=drop"`` to ``{topic: policy}``."""
+    return dict(pair.strip().split("=", 1) for pair in spec.split(",") if "=" in pair)
+
+
+class AuditSink:
+    """Per-topic audit policy in front of a batched background writer."""
+
+    def __init__(
+        self,
+        write: Callable[[List[Dict[str, Any]]], None],
+        *,
+        default: str = "full",
+        policies: Optional[Dict[str, str]] = None,
+        interval_ms: int = 100,
+        max_batch: int = 1000,
+        max_pending: int = 100_000,
+    ):
+        self.write = write
+        self.default = default
+        self.policies = dict(policies or {})
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self._rows: Deque[Dict[str, Any]] = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.counts = {"recorded": 0, "sampled_out": 0, "dropped": 0, "overflow": 0, "written": 0, "errors": 0}
+
+    def _keep(self, topic: str) -> bool:
+        policy = self.policies.get(topic, self.default)
+        if policy == "full":
+            return True
+        if policy.startswith("sample:"):
+            if random.random() < float(policy.split(":", 1)[1]):
+                return True
+            self.counts["sampled_out"] += 1
+            return False
+        self.counts["dropped"] += 1
+        return False
+
+    def record(self, topic: str, data: Dict[str, Any]) -> None:
+        """Queue a ``bus_message`` row for ``topic``; never blocks on disk."""
+        with self._cond:
+            if not self._keep(topic):
+                return
+            if len(self._rows) >= self.max_pending:
+                # The writer is behind; shed the oldest audit rows, not publishes.
+                self._rows.popleft()
+                self.counts["overflow"] += 1
+            self._rows.append({"kind": "bus_message", "topic": topic, "payload": data})
+            self.counts["recorded"] += 1
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="bus-audit", daemon=True)
+                self._thread.start()
+            if len(self._rows) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self) -> int:
+        """Write everything buffered now; return the number of rows written."""
+        written = 0
+        while True:
+            with self._cond:
+                batch = [self._rows.popleft() for _ in range(min(self.max_batch, len(self._rows)))]
+            if not batch:
+                return written
+            with self._write_lock:
+                try:
+                    self.write(batch)
+                except Exception:  # pragma: no cover - the audit trail is best effort
+                    with self._cond:
+                        self.counts["errors"] += 1
+                    continue
+            with self._cond:
+                self.counts["written"] += len(batch)
+            written += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                if len(self._rows) < self.max_batch:
+                    self._cond.wait(self.interval)
+            self.flush()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.counts, pending=len(self._rows))
@@ -5,17 +5,166 @@ recorded to the knowledge base via :func:`kb.add_entry`. Both GET and POST
 operations support an optional retry mechanism with exponential backoff,
 configurable via the ``retries`` and ``backoff`` parameters on
 ``BusClient``.
+
+``BusClient.run`` long-polls ``/get`` for up to ``batch`` messages at a
+time. Each poll waits at most ``wait`` seconds on the server, then the
+client polls again. With ``stream=True`` it holds one server-sent events
+connection to ``/subscribe/sse`` instead and reconnects if it drops.
+
+Polled messages are leased for ``lease`` seconds. After each batch the client
+acknowledges the messages its handler processed and nacks the ones that
+raised, in a single ``/ack`` call. A crash before that call gets the batch
+redelivered. ``lease=None`` (and streaming) is at-most-once delivery.
+
+A full topic answers ``429`` with ``Retry-After``. Publishes wait that long
+and retry, for up to ``max_wait`` seconds in total; :func:`publish` does the
+same for callers that have no ``BusClient``.
+
+``base_url`` may list several shards, comma separated. Each topic is then
+sent to the shard that owns it (:mod:`bus_shard`), and :func:`publish_batch`
+sends one request per shard involved.
+
+The URL scheme also picks the transport (:mod:`bus_transport`): ``http://``,
+``http+unix://`` for a Unix domain socket, or ``local://`` for a bus running
+in this process.
 """
 
+import asyncio
+import json
 import os
 import requests
 import time
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
+from bus_shard import split, url_for
+from bus_transport import transport_for
 from kb import add_entry
 from core.settings import settings
 
 
+def _retry_after(response: requests.Response) -> float:
+    try:
+        return max(float(response.headers.get("Retry-After", 1)), 0.0)
+    except ValueError:
+        return 1.0
+
+
+def send_with_backpressure(send: Callable[[], requests.Response], max_wait: float = 30.0) -> requests.Response:
+    """Call ``send`` until it is not ``429``, sleeping ``Retry-After`` in between.
+
+    Gives up and returns the ``429`` once waiting again would exceed
+    ``max_wait`` seconds.
+    """
+    deadline = time.monotonic() + max_wait
+    while True:
+        r = send()
+        if r.status_code != 429:
+            return r
+        delay = _retry_after(r)
+        if time.monotonic() + delay > deadline:
+            return r
+        time.sleep(delay)
+
+
+def _delivery(priority: int, ttl: Optional[float]) -> Dict:
+    """``priority``/``ttl`` body fields, omitted at their defaults."""
+    out: Dict = {}
+    if priority:
+        out["priority"] = priority
+    if ttl is not None:
+        out["ttl"] = ttl
+    return out
+
+
+def publish(
+    base_url: str,
+    topic: str,
+    data: Dict,
+    *,
+    priority: int = 0,
+    ttl: Optional[float] = None,
+    token: Optional[str] = None,
+    max_wait: float = 30.0,
+) -> requests.Response:
+    """Publish one message, honouring the bus's backpressure signal.
+
+    Higher ``priority`` (up to 9) is delivered first; after ``ttl`` seconds an
+    undelivered message is dropped.
+    """
+    body = {"topic": topic, "data": data, **_delivery(priority, ttl)}
+    return _post(url_for(base_url, topic), "publish", body, token, max_wait)
+
+
+def publish_batch(
+    base_url: str,
+    messages: Optional[List[Tuple[str, Dict]]] = None,
+    *,
+    topics: Optional[List[str]] = None,
+    data: Optional[Dict] = None,
+    priority: int = 0,
+    ttl: Optional[float] = None,
+    token: Optional[str] = None,
+    max_wait: float = 30.0,
+) -> requests.Response:
+    """Publish ``(topic, data)`` pairs, or ``data`` to every topic in ``topics``, in one request.
+
+    ``priority`` and ``ttl`` apply to every message.
+
+    On a sharded bus this is one request per shard, and only all or nothing
+    within a shard. The combined response lists results in input order; the
+    messages of a shard that refused its part are marked ``full`` or
+    ``error``. It is ``429`` only if every shard was full. Raises
+    :class:`ValueError` without ``messages`` unless both ``topics`` and
+    ``data`` are given.
+    """
+    if messages is None:
+        if topics is None or data is None:
+            raise ValueError("pass messages, or topics and data")
+        messages = [(topic, data) for topic in topics]
+    delivery = _delivery(priority, ttl)
+    groups = split(base_url, [topic for topic, _ in messages])
+    if len(groups) <= 1:
+        url = next(iter(groups), url_for(base_url, ""))
+        if topics is not None:
+            return _post(url, "publish_batch", {"topics": topics, "data": data, **delivery}, token, max_wait)
+        body = {"messages": [{"topic": t, "data": d, **delivery} for t, d in messages]}
+        return _post(url, "publish_batch", body, token, max_wait)
+    results: List[Dict] = [{} for _ in messages]
+    statuses = []
+    for url, members in groups.items():
+        body = {"messages": [{"topic": t, "data": messages[i][1], **delivery} for i, t in members]}
+        r = _post(url, "publish_batch", body, token, max_wait)
+        statuses.append(r.status_code)
+        if r.status_code == 200:
+            for (i, _), res in zip(members, r.json()["results"]):
+                results[i] = res
+        else:
+            failed = "full" if r.status_code == 429 else f"error {r.status_code}"
+            for i, t in members:
+                results[i] = {"topic": t, "status": failed, "offset": None}
+    return _combined(200 if 200 in statuses else max(statuses), {"status": "ok", "results": results})
+
+
+def _combined(status_code: int, body: Dict) -> requests.Response:
+    """A response standing in for several per-shard ones."""
+    r = requests.Response()
+    r.status_code = status_code
+    r._content = json.dumps(body).encode("utf-8")
+    r.headers["Content-Type"] = "application/json"
+    return r
+
+
+def _post(base_url: str, endpoint: str, body: Dict, token: Optional[str], max_wait: float) -> requests.Response:
+    token = token or settings.BUS_TOKEN or os.environ.get("BUS_TOKEN")
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    url = f"{base_url.rstrip('/')}/{endpoint}"
+    transport = transport_for(url)
+    return send_with_backpressure(
+        lambda: transport.post(url, json=body, headers=headers, timeout=10),
+        max_wait,
+    )
+
+
 class BusClient:
     def __init__(
         self,
@@ -26,13 +175,24 @@ class BusClient:
         retries: int = 0,
         backoff: float = 0.0,
         token: Optional[str] = None,
+        batch: int = 100,
+        wait: float = 25.0,
+        stream: bool = False,
+        lease: Optional[float] = 60.0,
+        max_wait: float = 30.0,
     ):
-        self.base_url = base_url.rstrip('/')
+        self.shards = base_url
+        self.base_url = url_for(base_url, topic)
         self.topic = topic
         self.handler = handler
         self.retries = retries
         self.backoff = backoff
         self.token = token or settings.BUS_TOKEN or os.environ.get("BUS_TOKEN")
+        self.batch = batch
+        self.wait = wait
+        self.stream = stream and transport_for(self.base_url).streams
+        self.lease = lease
+        self.max_wait = max_wait
         self._stop = False
 
     def _request(
@@ -42,17 +202,22 @@ class BusClient:
         *,
         retries: Optional[int] = None,
         backoff: Optional[float] = None,
+        base_url: Optional[str] = None,
         **kwargs,
     ):
         retries = self.retries if retries is None else retries
         backoff = self.backoff if backoff is None else backoff
-        url = f"{self.base_url}/{endpoint}"
+        url = f"{base_url or self.base_url}/{endpoint}"
         headers = kwargs.pop("headers", {})
         if self.token:
             headers.setdefault("Authorization", f"Bearer {self.token}")
+        transport = transport_for(url)
         for attempt in range(retries + 1):
             try:
-                return requests.request(method, url, timeout=60, headers=headers, **kwargs)
+                kwargs.setdefault("timeout", 60)
+                return send_with_backpressure(
+                    lambda: transport.request(method, url, headers=headers, **kwargs), self.max_wait
+                )
             except Exception as exc:  # pragma: no cover - logging path
                 add_entry(kind="bus_client_error", data=f"{method.upper()} {url} failed: {exc}")
                 if attempt < retries:
@@ -61,13 +226,69 @@ class BusClient:
                         time.sleep(delay)
         return None
 
+    def poll(self) -> Optional[List[Dict]]:
+        """One long-poll: up to ``batch`` messages, ``[]`` on timeout, ``None`` on error.
+
+        With a ``lease`` the items are ``{"id", "data", "attempts"}`` envelopes.
+        """
+        params = {"topic": self.topic, "max": self.batch, "wait": self.wait}
+        if self.lease is not None:
+            params["lease"] = self.lease
+        r = self._request("get", "get", params=params, timeout=self.wait + 10)
+        if r is None or r.status_code != 200:
+            return None
+        return r.json()
+
+    def _handle(self, msg: Dict) -> bool:
+        try:
+            self.handler(msg)
+            return True
+        except Exception as exc:  # pragma: no cover - logging path
+            add_entry(kind="bus_client_error", data=f"handler failed on {self.topic}: {exc}")
+            return False
+
+    def _stream_once(self) -> None:
+        """Consume one ``/subscribe/sse`` connection until it ends or we stop."""
+        # The server sends a keepalive every 15 s, so a silent minute means
+        # the connection is dead.
+        r = self._request("get", "subscribe/sse", params={"topic": self.topic}, stream=True, timeout=(10, 60))
+        if r is None or r.status_code != 200:
+            time.sleep(1)
+            return
+        data: List[str] = []
+        try:
+            with r:
+                for line in r.iter_lines(decode_unicode=True):
+                    if self._stop:
+                        return
+                    if line.startswith("data:"):
+                        data.append(line[5:].lstrip())
+                    elif not line and data:
+                        self._handle(json.loads("\n".join(data)))
+                        data = []
+        except (requests.RequestException, OSError) as exc:
+            add_entry(kind="bus_client_error", data=f"stream {self.topic} dropped: {exc}")
+            time.sleep(1)
+
     def run(self):
         while not self._stop:
-            r = self._request("get", "get", params={"topic": self.topic})
-            if r and r.status_code == 200:
-                self.handler(r.json())
-            else:
+            if self.stream:
+                self._stream_once()
+                continue
+            messages = self.poll()
+            if messages is None:
                 time.sleep(1)
+                continue
+            if self.lease is None:
+                for msg in messages:
+                    self._handle(msg)
+                continue
+            done: List[str] = []
+            failed: List[str] = []
+            for envelope in messages:
+                (done if self._handle(envelope["data"]) else failed).append(envelope["id"])
+            if messages:
+                self._request("post", "ack", json={"topic": self.topic, "ids": done, "nack": failed})
 
     def stop(self):
         self._stop = True
@@ -79,11 +300,19 @@ class BusClient:
         *,
         retries: Optional[int] = None,
         backoff: Optional[float] = None,
+        priority: int = 0,
+        ttl: Optional[float] = None,
     ):
-        self._request(
+        """Publish ``data`` as ``{"text": data}`` without blocking the event loop.
+
+        The request, including any ``Retry-After`` waits, runs in a worker thread.
+        """
+        await asyncio.to_thread(
+            self._request,
             "post",
             "publish",
             retries=retries,
             backoff=backoff,
-            json={"topic": topic, "data": {"text": data}},
+            base_url=url_for(self.shards, topic),
+            json={"topic": topic, "data": {"text": data}, **_delivery(priority, ttl)},
         )
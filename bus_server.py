@@ -3,20 +3,236 @@
 All requests must supply an ``Authorization: Bearer`` header whose token
 matches the ``BUS_TOKEN`` environment variable. Requests with an invalid
 token return ``401 Unauthorized``.
+
+With ``BUS_LOG_DIR`` set (default ``data/bus_log``) every published message
+is appended to a durable per-topic log (:mod:`bus_log`). Delivered
+positions are committed as the ``bus`` consumer group, and startup refills
+the queues from the undelivered tail.
+
+Publishes are also audited as ``bus_message`` KB rows, written in batches
+by a background sink (:mod:`bus_audit`) so the request never waits on
+SQLite. ``BUS_AUDIT`` sets the default policy (``full``, ``drop`` or
+``sample:<rate>``); ``BUS_AUDIT_POLICIES`` overrides it per topic. The older
+``BUS_KB_MIRROR=0`` still means ``BUS_AUDIT=drop``.
+
+``/get?lease=S`` hands messages out on a lease instead of removing them:
+they stay hidden for ``S`` seconds and come back unless acknowledged via
+``/ack`` (one call per batch). A message leased ``BUS_MAX_ATTEMPTS`` times
+without an ack moves to the ``<topic>.dlq`` dead-letter topic.
+
+Queues are bounded by ``BUS_QUEUE_MAX`` messages and ``BUS_QUEUE_MAX_BYTES``
+payload bytes per topic, and ``BUS_MEMORY_MAX_BYTES`` across topics. A full
+topic applies its policy: ``block`` answers ``429`` with ``Retry-After``,
+``drop_oldest`` evicts from the head, ``drop_newest`` discards the publish.
+``BUS_QUEUE_POLICY`` sets the default; ``BUS_TOPIC_POLICIES`` overrides it
+per topic (``CFO=drop_oldest,audit=drop_newest``). ``/stats`` reports depth
+and queued bytes.
+
+Publishes may carry a ``priority`` (``0``-``9``, default ``0``) and a ``ttl``
+in seconds. Each topic keeps one FIFO lane per priority and serves the
+highest non-empty lane first. A message past its TTL is discarded when it
+reaches the head of its lane instead of being delivered. ``/stats`` reports
+per-lane depth, the age of the oldest queued message and how long
+delivered messages waited.
+
+One process serves every topic by default. For a sharded bus, run several
+processes with the same ``BUS_SHARDS`` (every shard's URL, comma separated)
+and each one's own ``BUS_SHARD`` URL, ``BUS_PORT`` and ``BUS_LOG_DIR``.
+Clients pick the owning shard themselves (:mod:`bus_shard`); a request for a
+topic this process does not own answers ``421 Misdirected Request``.
+
+With ``BUS_UDS`` set the server listens on that Unix domain socket instead of
+``BUS_PORT``; clients reach it as ``http+unix://<quoted path>``.
 """
 
+import atexit
+import itertools
+import json
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+import time
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import anyio
 from collections import defaultdict, deque
-from typing import Dict, Deque
-from kb import add_entry
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from bus_log import BusLog
+from bus_audit import AuditSink, parse_policies
+from bus_shard import DEAD_LETTER_SUFFIX, url_for
+from kb import add_entries, atail
+
+
+PRIORITY_LEVELS = 10
+
+
+class _Item:
+    """A queued message; ``seq`` is its log offset when the log is enabled.
+
+    ``expires`` is a wall-clock deadline (``time.time()``) so it survives a
+    restart through the log; ``enqueued`` only feeds queue-age metrics.
+    """
+
+    __slots__ = ("seq", "data", "attempts", "size", "priority", "expires", "enqueued")
+
+    def __init__(
+        self,
+        seq: int,
+        data: dict,
+        size: int = 0,
+        attempts: int = 0,
+        priority: int = 0,
+        expires: Optional[float] = None,
+    ):
+        self.seq = seq
+        self.data = data
+        self.size = size
+        self.attempts = attempts
+        self.priority = priority
+        self.expires = expires
+        self.enqueued = time.monotonic()
+
+
+class _Queue:
+    """Priority lanes of :class:`_Item`, FIFO within each lane.
+
+    Lane ``p`` holds messages published with priority ``p`` and higher lanes
+    are served first. Every lane stays in offset order. Expired messages are
+    discarded lazily, when they reach the head of their lane. Running totals
+    of payload bytes and of per-lane waiting time are kept for ``/stats``.
+    """
+
+    def __init__(self, items=()):
+        self.lanes: List[deque] = [deque() for _ in range(PRIORITY_LEVELS)]
+        self.bytes = 0
+        self.expired = 0
+        # non-zero priorities seen; lanes then deliver out of offset order
+        self.used = set()
+        # per lane: [delivered, total wait, longest wait] in seconds
+        self.waits = [[0, 0.0, 0.0] for _ in range(PRIORITY_LEVELS)]
+        self._len = 0
+        self.extend(items)
+
+    def __len__(self):
+        return self._len
+
+    def append(self, item):
+        if item.priority:
+            self.used.add(item.priority)
+        self.lanes[item.priority].append(item)
+        self._len += 1
+        self.bytes += item.size
+
+    def appendleft(self, item):
+        self.lanes[item.priority].appendleft(item)
+        self._len += 1
+        self.bytes += item.size
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def extendleft(self, items):
+        for item in items:
+            self.appendleft(item)
+
+    def _remove(self, lane: deque) -> _Item:
+        item = lane.popleft()
+        self._len -= 1
+        self.bytes -= item.size
+        return item
+
+    def expire(self) -> int:
+        """Drop expired messages from the head of every lane; return how many."""
+        now = time.time()
+        n = 0
+        for lane in self.lanes:
+            while lane and lane[0].expires is not None and lane[0].expires <= now:
+                self._remove(lane)
+                n += 1
+        self.expired += n
+        return n
+
+    def take(self) -> Optional[_Item]:
+        """Dequeue the oldest live message of the highest non-empty lane."""
+        now = time.time()
+        for priority in range(PRIORITY_LEVELS - 1, -1, -1):
+            lane = self.lanes[priority]
+            while lane:
+                item = self._remove(lane)
+                if item.expires is not None and item.expires <= now:
+                    self.expired += 1
+                    continue
+                wait = time.monotonic() - item.enqueued
+                stats = self.waits[priority]
+                stats[0] += 1
+                stats[1] += wait
+                stats[2] = max(stats[2], wait)
+                return item
+        return None
+
+    def evict(self) -> Optional[_Item]:
+        """Remove the oldest message of the lowest non-empty lane."""
+        for lane in self.lanes:
+            if lane:
+                return self._remove(lane)
+        return None
+
+    def clear(self):
+        for lane in self.lanes:
+            lane.clear()
+        self._len = 0
+        self.bytes = 0
+
+    def lane_stats(self) -> Dict[int, Dict[str, float]]:
+        """Depth, age of the oldest message and waiting time of delivered ones, per used lane."""
+        now = time.monotonic()
+        out = {}
+        for priority, lane in enumerate(self.lanes):
+            delivered, total, longest = self.waits[priority]
+            if lane or delivered:
+                out[priority] = {
+                    "depth": len(lane),
+                    "oldest_ms": round((now - lane[0].enqueued) * 1000, 1) if lane else 0.0,
+                    "delivered": delivered,
+                    "wait_avg_ms": round(total / delivered * 1000, 1) if delivered else 0.0,
+                    "wait_max_ms": round(longest * 1000, 1),
+                }
+        return out
+
+
+class QueueFull(Exception):
+    """The topic is at capacity and its policy is ``block``."""
+
 
 app = FastAPI()
-queues: Dict[str, Deque[dict]] = defaultdict(deque)
+queues: Dict[str, _Queue] = defaultdict(_Queue)
 conds: Dict[str, anyio.Condition] = defaultdict(anyio.Condition)
+# topic -> receipt -> (item, monotonic deadline)
+leases: Dict[str, Dict[str, Tuple[_Item, float]]] = defaultdict(dict)
+_seqs: Dict[str, Iterator[int]] = defaultdict(itertools.count)
+bus_log: Optional[BusLog] = None
+GROUP = "bus"
+MAX_ATTEMPTS = int(os.environ.get("BUS_MAX_ATTEMPTS", 5))
+QUEUE_MAX = int(os.environ.get("BUS_QUEUE_MAX", 10000))
+QUEUE_MAX_BYTES = int(os.environ.get("BUS_QUEUE_MAX_BYTES", 16 << 20))
+MEMORY_MAX_BYTES = int(os.environ.get("BUS_MEMORY_MAX_BYTES", 256 << 20))
+QUEUE_POLICY = os.environ.get("BUS_QUEUE_POLICY", "block")
+TOPIC_POLICIES: Dict[str, str] = dict(
+    pair.split("=", 1) for pair in os.environ.get("BUS_TOPIC_POLICIES", "").split(",") if "=" in pair
+)
+RETRY_AFTER = int(os.environ.get("BUS_RETRY_AFTER", 1))
+SHARDS = os.environ.get("BUS_SHARDS", "")
+SHARD = os.environ.get("BUS_SHARD", "").rstrip("/")
+audit = AuditSink(
+    lambda rows: add_entries(rows),
+    default=os.environ.get("BUS_AUDIT", "drop" if os.environ.get("BUS_KB_MIRROR") == "0" else "full"),
+    policies=parse_policies(os.environ.get("BUS_AUDIT_POLICIES", "")),
+)
+atexit.register(audit.close)
+dropped: Dict[str, int] = defaultdict(int)
+rejected: Dict[str, int] = defaultdict(int)
 
 
 security = HTTPBearer()
@@ -33,31 +249,540 @@ def verify_token(
 class PublishReq(BaseModel):
     topic: str
     data: dict
+    priority: int = Field(0, ge=0, lt=PRIORITY_LEVELS)
+    ttl: Optional[float] = Field(None, gt=0)
+
+
+class PublishBatchReq(BaseModel):
+    """Either ``messages`` or one ``data`` payload for every topic in ``topics``."""
+
+    messages: Optional[List[PublishReq]] = None
+    topics: Optional[List[str]] = None
+    data: Optional[dict] = None
+    priority: int = Field(0, ge=0, lt=PRIORITY_LEVELS)
+    ttl: Optional[float] = Field(None, gt=0)
+
+
+class AckReq(BaseModel):
+    topic: str
+    ids: List[str] = []
+    nack: List[str] = []
+
+
+class OffsetReq(BaseModel):
+    topic: str
+    group: str
+    offset: int
+
+
+@app.on_event("startup")
+async def open_log():
+    """Open the durable log and requeue everything not yet delivered."""
+    global bus_log
+    directory = os.environ.get("BUS_LOG_DIR", "data/bus_log")
+    if not directory:
+        return
+    bus_log = BusLog(Path(directory))
+    for topic, info in bus_log.stats().items():
+        queue = queues[topic]
+        queue.clear()
+        start = bus_log.committed(topic, GROUP)
+        for offset, data, meta in bus_log.scan(topic, start, meta=True):
+            priority = meta.get("priority", 0)
+            if offset < info["offsets"].get(f"{GROUP}@{priority}", start):
+                continue  # delivered ahead of lower lanes
+            queue.append(_Item(offset, data, _size(data), priority=priority, expires=meta.get("expires")))
+
+
+@app.on_event("shutdown")
+async def close_log():
+    global bus_log
+    audit.flush()
+    if bus_log is not None:
+        bus_log.close()
+        bus_log = None
+
+
+def _delivered(topic: str) -> None:
+    """Commit the oldest undelivered offset as the ``bus`` group's position.
+
+    Each priority lane stays in offset order (expired leases go back to the
+    head, and they are older than anything still in their lane), so that is
+    the smallest of the lane heads and the oldest outstanding lease. Once a
+    topic has used priorities, lanes deliver out of offset order, so each
+    lane's own position is also committed as ``bus@<priority>``; recovery
+    skips what a lane already delivered past the ``bus`` offset.
+    """
+    if bus_log is None:
+        return
+    queue = queues[topic]
+    pending = [(item.priority, item.seq) for item, _ in leases[topic].values()]
+    pending += [(priority, lane[0].seq) for priority, lane in enumerate(queue.lanes) if lane]
+    end = bus_log.end_offset(topic)
+    bus_log.commit(topic, GROUP, min(seq for _, seq in pending) if pending else end)
+    if queue.used:
+        positions = dict.fromkeys(queue.used | {0}, end)
+        for priority, seq in pending:
+            positions[priority] = min(positions[priority], seq)
+        for priority, seq in positions.items():
+            bus_log.commit(topic, f"{GROUP}@{priority}", seq)
+
+
+def _size(data: dict) -> int:
+    return len(json.dumps(data, separators=(",", ":")))
+
+
+def _drop_expired(topic: str) -> None:
+    """Discard ``topic``'s expired head messages so they stop taking up room."""
+    if queues[topic].expire():
+        _delivered(topic)
+
+
+def _full(topic: str, size: int, count: int = 0, nbytes: int = 0, total: int = 0) -> bool:
+    """Would ``size`` more bytes overflow ``topic``, after ``count``/``nbytes`` already promised?"""
+    queue = queues[topic]
+    return (
+        len(queue) + count >= QUEUE_MAX
+        or queue.bytes + nbytes + size > QUEUE_MAX_BYTES
+        or sum(q.bytes for q in queues.values()) + total + size > MEMORY_MAX_BYTES
+    )
+
+
+def _make_room(topic: str, size: int) -> bool:
+    """Apply ``topic``'s policy before adding ``size`` bytes.
+
+    Returns ``False`` when the message should be discarded. Raises
+    :class:`QueueFull` under ``block``.
+    """
+    _drop_expired(topic)
+    if not _full(topic, size):
+        return True
+    queue = queues[topic]
+    policy = TOPIC_POLICIES.get(topic, QUEUE_POLICY)
+    if policy == "drop_oldest":
+        # Evict only when the message fits once the topic is empty; a
+        # message that is refused anyway leaves the queue intact.
+        others = sum(q.bytes for t, q in queues.items() if t != topic)
+        if QUEUE_MAX > 0 and size <= QUEUE_MAX_BYTES and others + size <= MEMORY_MAX_BYTES:
+            while queue and _full(topic, size):
+                queue.evict()
+                dropped[topic] += 1
+            return True
+    elif policy == "drop_newest":
+        dropped[topic] += 1
+        return False
+    rejected[topic] += 1
+    raise QueueFull(topic)
+
+
+def _put(
+    topic: str, data: dict, size: int, priority: int = 0, ttl: Optional[float] = None
+) -> Tuple[bool, Optional[int]]:
+    """Log and queue ``data`` without yielding; return whether it was kept and its offset."""
+    if not _make_room(topic, size):
+        return False, None
+    expires = time.time() + ttl if ttl else None
+    meta = {k: v for k, v in (("priority", priority), ("expires", expires)) if v}
+    offset = bus_log.append(topic, data, meta) if bus_log is not None else None
+    seq = next(_seqs[topic]) if offset is None else offset
+    queues[topic].append(_Item(seq, data, size, priority=priority, expires=expires))
+    return True, offset
+
+
+async def _wake(topic: str, n: int = 1) -> None:
+    async with conds[topic]:
+        conds[topic].notify(n)
+
+
+async def _enqueue(
+    topic: str, data: dict, priority: int = 0, ttl: Optional[float] = None
+) -> Tuple[bool, Optional[int]]:
+    """Log and queue ``data``; return whether it was kept and its log offset."""
+    kept, offset = _put(topic, data, _size(data), priority, ttl)
+    if kept:
+        await _wake(topic)
+    return kept, offset
+
+
+async def _redeliver(topic: str, items: List[_Item]) -> None:
+    """Put unacknowledged items back at the head, or dead-letter them."""
+    retry = []
+    for item in sorted(items, key=lambda i: i.seq):
+        if item.attempts >= MAX_ATTEMPTS:
+            try:
+                await _enqueue(topic + DEAD_LETTER_SUFFIX, {"topic": topic, "attempts": item.attempts, "data": item.data})
+            except QueueFull:
+                dropped[topic + DEAD_LETTER_SUFFIX] += 1
+        else:
+            retry.append(item)
+    queues[topic].extendleft(reversed(retry))
+    if retry:
+        await _wake(topic, len(retry))
+    _delivered(topic)
+
+
+async def _expire(topic: str) -> None:
+    held = leases[topic]
+    if not held:
+        return
+    now = time.monotonic()
+    expired = [receipt for receipt, (_, deadline) in held.items() if deadline <= now]
+    if expired:
+        await _redeliver(topic, [held.pop(receipt)[0] for receipt in expired])
+
+
+def _check_owner(topic: str) -> None:
+    """Refuse topics that hash to another shard, so a stale client map fails loudly."""
+    if SHARD and SHARDS:
+        owner = url_for(SHARDS, topic)
+        if owner != SHARD:
+            raise HTTPException(status_code=421, detail=f"topic {topic} is served by {owner}")
+
+
+def _require_log() -> BusLog:
+    if bus_log is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="bus log disabled")
+    return bus_log
 
 
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "shard": SHARD} if SHARD else {"status": "ok"}
 
 
 @app.post("/publish")
 async def publish(req: PublishReq, _: bool = Depends(verify_token)):
-    queues[req.topic].append(req.data)
-    async with conds[req.topic]:
-        conds[req.topic].notify(1)
-    add_entry(kind="bus_message", topic=req.topic, payload=req.data)
+    _check_owner(req.topic)
+    try:
+        kept, offset = await _enqueue(req.topic, req.data, req.priority, req.ttl)
+    except QueueFull:
+        raise _too_many(req.topic)
+    if not kept:
+        return {"status": "dropped"}
+    audit.record(req.topic, req.data)
+    return {"status": "ok"} if offset is None else {"status": "ok", "offset": offset}
+
+
+def _too_many(topic: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=f"topic {topic} is full",
+        headers={"Retry-After": str(RETRY_AFTER)},
+    )
+
+
+@app.post("/publish_batch")
+async def publish_batch(req: PublishBatchReq, _: bool = Depends(verify_token)):
+    """Publish many messages with one request.
+
+    The batch is all or nothing for ``block`` topics: if any of them
+    lacks room, nothing is queued and the answer is ``429``. Messages that
+    other policies cannot fit are reported as ``dropped``.
+    """
+    if req.messages is not None and req.topics is None and req.data is None:
+        pairs = [(m.topic, m.data, m.priority, m.ttl) for m in req.messages]
+    elif req.messages is None and req.topics is not None and req.data is not None:
+        pairs = [(topic, req.data, req.priority, req.ttl) for topic in req.topics]
+    else:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="send messages, or topics and data")
+    for topic in {pair[0] for pair in pairs}:
+        _check_owner(topic)
+        _drop_expired(topic)
+    sized = [(topic, data, _size(data), priority, ttl) for topic, data, priority, ttl in pairs]
+    counts: Dict[str, int] = defaultdict(int)
+    nbytes: Dict[str, int] = defaultdict(int)
+    total = 0
+    for topic, _data, size, _priority, _ttl in sized:
+        if TOPIC_POLICIES.get(topic, QUEUE_POLICY) == "block" and _full(topic, size, counts[topic], nbytes[topic], total):
+            rejected[topic] += 1
+            raise _too_many(topic)
+        counts[topic] += 1
+        nbytes[topic] += size
+        total += size
+    # No awaits until every message is queued, so the batch lands as a unit.
+    results: List[Dict[str, Any]] = []
+    kept_messages: List[Tuple[str, dict]] = []
+    for topic, data, size, priority, ttl in sized:
+        try:
+            kept, offset = _put(topic, data, size, priority, ttl)
+        except QueueFull:
+            # Only a drop_oldest topic gets here: evicting its own queue
+            # cannot make room, so this message is dropped, not the batch.
+            kept, offset = False, None
+        if kept:
+            kept_messages.append((topic, data))
+        results.append({"topic": topic, "status": "ok" if kept else "dropped", "offset": offset})
+    for topic in counts:
+        await _wake(topic, counts[topic])
+    for topic, data in kept_messages:
+        audit.record(topic, data)
+    return {"status": "ok", "results": results}
+
+
+@app.get("/stats")
+async def stats(_: bool = Depends(verify_token)):
+    """Queue depth, queued payload bytes and backpressure counters per topic."""
+    topics = {
+        topic: {
+            "depth": len(queue),
+            "bytes": queue.bytes,
+            "leased": len(leases[topic]),
+            "dropped": dropped[topic],
+            "rejected": rejected[topic],
+            "expired": queue.expired,
+            "policy": TOPIC_POLICIES.get(topic, QUEUE_POLICY),
+            "lanes": queue.lane_stats(),
+        }
+        for topic, queue in queues.items()
+    }
+    return {"topics": topics, "total_bytes": sum(q.bytes for q in queues.values()), "audit": audit.stats()}
+
+
+@app.get("/log")
+async def read_log(
+    topic: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, alias="max", ge=1, le=1000),
+    _: bool = Depends(verify_token),
+):
+    """Replay ``topic`` from ``offset``, independent of queue delivery."""
+    log = _require_log()
+    messages = [{"offset": o, "data": d} for o, d in log.read(topic, max(offset, log.start_offset(topic)), limit)]
+    nxt = messages[-1]["offset"] + 1 if messages else max(offset, log.start_offset(topic))
+    return {"messages": messages, "next": nxt, "end": log.end_offset(topic)}
+
+
+@app.get("/offsets")
+async def get_offset(topic: str, group: str, _: bool = Depends(verify_token)):
+    return {"topic": topic, "group": group, "offset": _require_log().committed(topic, group)}
+
+
+@app.post("/offsets")
+async def commit_offset(req: OffsetReq, _: bool = Depends(verify_token)):
+    _require_log().commit(req.topic, req.group, req.offset)
     return {"status": "ok"}
 
 
+MAX_BATCH = 1000
+MAX_WAIT = 55.0
+
+
+async def _wait_for(topic: str, wait: Optional[float]) -> bool:
+    """Block until ``topic`` has a message; ``False`` if ``wait`` seconds pass first.
+
+    Expired leases are requeued on the way, and the wait is cut short when
+    the next lease is due so its message is redelivered promptly.
+    """
+    deadline = None if wait is None else time.monotonic() + wait
+    while True:
+        await _expire(topic)
+        _drop_expired(topic)
+        if queues[topic]:
+            return True
+        now = time.monotonic()
+        timeout = None if deadline is None else deadline - now
+        if timeout is not None and timeout <= 0:
+            return False
+        if leases[topic]:
+            due = min(d for _, d in leases[topic].values()) - now
+            timeout = due if timeout is None else min(timeout, due)
+        with anyio.move_on_after(timeout):
+            async with conds[topic]:
+                while not queues[topic]:
+                    await conds[topic].wait()
+
+
 @app.get("/get")
-async def get(topic: str, _: bool = Depends(verify_token)):
-    while not queues[topic]:
-        async with conds[topic]:
-            await conds[topic].wait()
-    data = queues[topic].popleft()
-    return data
+async def get(
+    topic: str,
+    limit: Optional[int] = Query(None, alias="max", ge=1),
+    wait: Optional[float] = Query(None, ge=0),
+    lease: Optional[float] = Query(None, gt=0, le=3600),
+    _: bool = Depends(verify_token),
+):
+    """Long-poll ``topic``.
+
+    Without ``max`` one message is returned, as before, waiting indefinitely
+    (or ``204`` once ``wait`` seconds pass). With ``max`` up to that many
+    queued messages come back as a list, or ``[]`` after ``wait`` seconds
+    (default and ceiling ``MAX_WAIT``). With ``lease`` the list holds
+    ``{"id", "data", "attempts"}`` envelopes to acknowledge via ``/ack``.
+    """
+    _check_owner(topic)
+    if limit is None and lease is None:
+        # take() can still find only messages that expired since the wait.
+        item = None
+        while item is None:
+            if not await _wait_for(topic, wait):
+                return Response(status_code=status.HTTP_204_NO_CONTENT)
+            item = queues[topic].take()
+        _delivered(topic)
+        return item.data
+    if not await _wait_for(topic, min(wait if wait is not None else MAX_WAIT, MAX_WAIT)):
+        return []
+    queue = queues[topic]
+    items: List[_Item] = []
+    while len(items) < min(limit or 1, MAX_BATCH):
+        item = queue.take()
+        if item is None:
+            break
+        items.append(item)
+    if lease is None:
+        _delivered(topic)
+        return [item.data for item in items]
+    deadline = time.monotonic() + lease
+    out = []
+    for item in items:
+        item.attempts += 1
+        # A receipt names one delivery, so a late ack cannot settle a redelivery.
+        receipt = f"{item.seq}-{item.attempts}"
+        leases[topic][receipt] = (item, deadline)
+        out.append({"id": receipt, "data": item.data, "attempts": item.attempts})
+    return out
+
+
+@app.post("/ack")
+async def ack(req: AckReq, _: bool = Depends(verify_token)):
+    """Settle leased deliveries: ``ids`` are done, ``nack`` are redelivered now."""
+    _check_owner(req.topic)
+    held = leases[req.topic]
+    acked = sum(held.pop(receipt, None) is not None for receipt in req.ids)
+    retry = [held.pop(receipt)[0] for receipt in req.nack if receipt in held]
+    if retry:
+        await _redeliver(req.topic, retry)
+    else:
+        _delivered(req.topic)
+    return {"acked": acked, "nacked": len(retry)}
+
+
+def _token_ok(token: Optional[str]) -> bool:
+    expected = os.environ.get("BUS_TOKEN")
+    return bool(expected) and token == expected
+
+
+@app.websocket("/subscribe")
+async def subscribe(websocket: WebSocket, topic: str, credit: int = 0):
+    """Stream ``topic`` over a WebSocket with credit-based flow control.
+
+    The server sends at most as many messages as the client has granted
+    credits, via the ``credit`` query parameter and ``{"credit": n}`` frames.
+    Each message is one ``{"topic": ..., "data": ...}`` frame. Ungranted
+    messages stay queued for other consumers.
+    """
+    auth = websocket.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else websocket.query_params.get("token")
+    if not _token_ok(token) or (SHARD and SHARDS and url_for(SHARDS, topic) != SHARD):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    credits = {"n": max(credit, 0)}
+    granted = anyio.Event()
+    if credits["n"]:
+        granted.set()
+
+    async def receive_credits():
+        while True:
+            frame = await websocket.receive_json()
+            credits["n"] += max(int(frame.get("credit", 0)), 0)
+            if credits["n"]:
+                granted.set()
+
+    async def send_messages():
+        nonlocal granted
+        while True:
+            await granted.wait()
+            await _wait_for(topic, None)
+            queue = queues[topic]
+            while credits["n"]:
+                item = queue.take()
+                if item is None:
+                    break
+                credits["n"] -= 1
+                try:
+                    await websocket.send_json({"topic": topic, "data": item.data})
+                except Exception:
+                    queue.appendleft(item)
+                    return  # closed; the receiver sees the disconnect
+                except BaseException:
+                    queue.appendleft(item)
+                    raise
+                _delivered(topic)
+            if not credits["n"]:
+                granted = anyio.Event()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(send_messages)
+        try:
+            await receive_credits()
+        except WebSocketDisconnect:
+            pass
+        tg.cancel_scope.cancel()
+
+
+@app.get("/subscribe/sse")
+async def subscribe_sse(topic: str, _: bool = Depends(verify_token)):
+    """Server-sent events fallback for :func:`subscribe`.
+
+    Messages are dequeued one at a time, only after the previous event was
+    handed to the transport, so a slow reader is throttled by TCP instead
+    of draining the queue into a buffer.
+    """
+    _check_owner(topic)
+
+    async def events():
+        while True:
+            if not await _wait_for(topic, 15):
+                yield ": keepalive\n\n"
+                continue
+            queue = queues[topic]
+            item = queue.take()
+            if item is None:
+                continue
+            try:
+                yield f"event: message\ndata: {json.dumps(item.data)}\n\n"
+            except BaseException:
+                queue.appendleft(item)
+                raise
+            _delivered(topic)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/kb/stream")
+async def kb_stream(
+    request: Request,
+    since_id: Optional[int] = None,
+    kinds: Optional[str] = None,
+    _: bool = Depends(verify_token),
+):
+    """Server-sent events for new KB entries, one event per row.
+
+    Resumes after ``since_id`` (or the ``Last-Event-ID`` header sent by
+    reconnecting clients); ``kinds`` is a comma-separated filter.
+    """
+    last_event = request.headers.get("last-event-id")
+    start = since_id
+    if last_event:
+        try:
+            start = int(last_event)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Last-Event-ID must be an entry id")
+    feed = atail(start, kinds=kinds.split(",") if kinds else None, heartbeat=15)
+
+    # Async, so an idle client holds no worker thread; kb reads are short steps.
+    async def events():
+        async for row in feed:
+            if row is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {row['id']}\nevent: {row['kind']}\ndata: {json.dumps(row)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("bus_server:app", host="0.0.0.0", port=7088)
+    if os.environ.get("BUS_UDS"):
+        uvicorn.run("bus_server:app", uds=os.environ["BUS_UDS"])
+    else:
+        uvicorn.run("bus_server:app", host="0.0.0.0", port=int(os.environ.get("BUS_PORT", 7088)))
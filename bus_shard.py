@@ -0,0 +1,70 @@
+"""Consistent-hash shard map for a multi-process bus.
+
+A sharded bus is several ``bus_server`` processes, each owning a subset of
+topics. ``BUS_URL`` then lists every shard, comma separated, and
+:func:`url_for` picks the owner of a topic with a :class:`HashRing`. Every
+process that parses the same list computes the same owner, so clients talk
+to shards directly with no router in between. A single URL is the ordinary
+one-process bus and is returned unchanged.
+
+Dead-letter topics hash as their parent topic, so ``X.dlq`` lives on the
+shard that moves messages into it.
+"""
+
+import bisect
+import hashlib
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+DEAD_LETTER_SUFFIX = ".dlq"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shard_key(topic: str) -> str:
+    """The key a topic is placed by; strips the dead-letter suffix."""
+    while topic.endswith(DEAD_LETTER_SUFFIX):
+        topic = topic[: -len(DEAD_LETTER_SUFFIX)]
+    return topic
+
+
+class HashRing:
+    """Maps keys to nodes; adding a node moves only about ``1/N`` of the keys."""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 128):
+        self.nodes = list(dict.fromkeys(nodes))
+        if not self.nodes:
+            raise ValueError("a hash ring needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._keys = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: str) -> str:
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+def parse_urls(base_url: str) -> List[str]:
+    return [u.strip().rstrip("/") for u in base_url.split(",") if u.strip()]
+
+
+@lru_cache(maxsize=16)
+def ring(base_url: str) -> HashRing:
+    return HashRing(parse_urls(base_url))
+
+
+def url_for(base_url: str, topic: str) -> str:
+    """The shard of ``base_url`` (one URL or a comma-separated list) that owns ``topic``."""
+    if "," not in base_url:
+        return base_url.rstrip("/")
+    return ring(base_url).node(shard_key(topic))
+
+
+def split(base_url: str, topics: Iterable[str]) -> Dict[str, List[Tuple[int, str]]]:
+    """Group ``topics`` by owning shard as ``{url: [(position, topic), ...]}``."""
+    groups: Dict[str, List[Tuple[int, str]]] = {}
+    for i, topic in enumerate(topics):
+        groups.setdefault(url_for(base_url, topic), []).append((i, topic))
+    return groups
@@ -0,0 +1,240 @@
+"""Transports carrying :mod:`bus_client` requests to the bus.
+
+The scheme of ``BUS_URL`` picks one, so application code never changes:
+
+- ``http://host:port`` – :class:`HttpTransport`, plain ``requests`` calls.
+- ``http+unix://<quoted socket path>`` – :class:`UnixTransport`, the same
+  HTTP API over a Unix domain socket (``bus_server`` listens on one when
+  ``BUS_UDS`` is set). It skips TCP and keeps one connection per thread.
+- ``local://`` – :class:`LocalTransport`, the bus running inside the calling
+  process. Requests call the ``bus_server`` handlers directly on a private
+  asyncio loop: no sockets, no JSON round trip and no token check.
+
+Every transport answers with an object shaped like ``requests.Response``
+(``status_code``, ``ok``, ``headers``, ``json()``, ``iter_lines()``).
+"""
+
+import asyncio
+import atexit
+import http.client
+import json as _json
+import socket
+import threading
+from typing import Any, Dict, Iterator, Mapping, Optional
+from urllib.parse import unquote, urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class Reply:
+    """Minimal ``requests.Response`` stand-in for the non-HTTP transports."""
+
+    def __init__(
+        self,
+        status_code: int,
+        body: Any = None,
+        headers: Optional[Mapping[str, str]] = None,
+        lines: Optional[Iterator[bytes]] = None,
+        close: Any = None,
+    ):
+        self.status_code = status_code
+        self.body = body
+        self.headers = CaseInsensitiveDict(headers or {})
+        self._lines = lines
+        self._close = close
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self) -> Any:
+        if isinstance(self.body, bytes):
+            return _json.loads(self.body)
+        return self.body
+
+    def iter_lines(self, decode_unicode: bool = False) -> Iterator:
+        for line in self._lines or iter(()):
+            line = line.rstrip(b"\r\n")
+            yield line.decode("utf-8") if decode_unicode else line
+
+    def close(self) -> None:
+        if self._close is not None:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class HttpTransport:
+    """The default: ``requests`` over TCP."""
+
+    streams = True
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return requests.request(method, url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return requests.post(url, **kwargs)
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float]):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class UnixTransport:
+    """HTTP/1.1 over a Unix domain socket, one keep-alive connection per thread."""
+
+    streams = True
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connection(self, path: str, timeout: Optional[float]) -> _UnixConnection:
+        conns = self._local.__dict__.setdefault("conns", {})
+        conn = conns.get(path)
+        if conn is None:
+            conn = conns[path] = _UnixConnection(path, timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Any = None,
+        stream: bool = False,
+    ) -> Reply:
+        parts = urlsplit(url)
+        path = unquote(parts.netloc)
+        target = parts.path or "/"
+        if params:
+            target += "?" + urlencode(params)
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _json.dumps(json).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        if isinstance(timeout, tuple):
+            timeout = timeout[-1]
+        if stream:
+            # A stream owns its connection until the caller closes it.
+            conn = _UnixConnection(path, timeout)
+            conn.request(method.upper(), target, body=body, headers=headers)
+            resp = conn.getresponse()
+            return Reply(resp.status, None, dict(resp.getheaders()), iter(resp.readline, b""), conn.close)
+        conn = self._connection(path, timeout)
+        for attempt in range(2):
+            try:
+                conn.request(method.upper(), target, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                break
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server closed an idle keep-alive connection; retry once.
+                conn.close()
+                if attempt:
+                    raise
+        return Reply(resp.status, data, dict(resp.getheaders()))
+
+    def post(self, url: str, **kwargs) -> Reply:
+        return self.request("post", url, **kwargs)
+
+
+class LocalTransport:
+    """Calls ``bus_server`` in this process on a dedicated event loop.
+
+    The loop thread starts on first use and opens the bus log like a server
+    startup would. Streaming subscriptions are not offered; long-polls cost
+    nothing here.
+    """
+
+    streams = False
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _run(self, coro) -> Any:
+        with self._lock:
+            if self._loop is None:
+                import bus_server
+
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="bus-local", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(bus_server.open_log(), loop).result()
+                atexit.register(lambda: asyncio.run_coroutine_threadsafe(bus_server.close_log(), loop).result())
+                self._loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        **kwargs,
+    ) -> Reply:
+        import bus_server
+        from fastapi import HTTPException, Response
+        from pydantic import ValidationError
+
+        endpoint = urlsplit(url).path.strip("/")
+        params = params or {}
+        handlers = {
+            ("post", "publish"): lambda: bus_server.publish(bus_server.PublishReq(**json), True),
+            ("post", "publish_batch"): lambda: bus_server.publish_batch(bus_server.PublishBatchReq(**json), True),
+            ("post", "ack"): lambda: bus_server.ack(bus_server.AckReq(**json), True),
+            ("get", "get"): lambda: bus_server.get(
+                params["topic"], params.get("max"), params.get("wait"), params.get("lease"), True
+            ),
+            ("get", "stats"): lambda: bus_server.stats(True),
+            ("get", "health"): lambda: bus_server.health(),
+        }
+        handler = handlers.get((method.lower(), endpoint))
+        if handler is None:
+            return Reply(404, {"detail": f"{endpoint} is not available in-process"})
+        try:
+            result = self._run(handler())
+        except HTTPException as exc:
+            return Reply(exc.status_code, {"detail": exc.detail}, exc.headers)
+        except ValidationError as exc:
+            return Reply(422, {"detail": exc.errors()})
+        if isinstance(result, Response):
+            return Reply(result.status_code)
+        return Reply(200, result)
+
+    def post(self, url: str, **kwargs) -> Reply:
+        return self.request("post", url, **kwargs)
+
+
+_transports: Dict[str, Any] = {}
+_transports_lock = threading.Lock()
+
+
+def transport_for(url: str):
+    """The shared transport for ``url``'s scheme."""
+    scheme = urlsplit(url).scheme
+    kind = {"http+unix": UnixTransport, "local": LocalTransport}.get(scheme, HttpTransport)
+    with _transports_lock:
+        if kind.__name__ not in _transports:
+            _transports[kind.__name__] = kind()
+        return _transports[kind.__name__]
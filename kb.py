@@ -1,7 +1,38 @@
+"""SQLite-backed knowledge base shared by every service.
+
+Connections are pooled per thread and per database file: each thread opens
+its connection once, applies :data:`PRAGMAS` and brings the schema up to
+date via ``PRAGMA user_version``. Later calls reuse the prepared
+connection instead of paying for ``connect()`` and DDL on every request.
+
+Writes are synchronous by default. :func:`enable_write_behind` (or
+``KB_WRITE_BEHIND=1``) switches :func:`add_entry` to a group-commit queue
+drained by a background thread; call :func:`flush` when a caller needs its
+rows to be visible immediately.
+"""
+
+import argparse
+import ast
+import asyncio
+import atexit
+import functools
+import gzip
+import hashlib
+import heapq
+import inspect
+import itertools
+import json
+import os
+import shutil
 import sqlite3
 import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable, List, Dict
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from hnet.dynamic_chunker import DynamicChunker
 
@@ -10,54 +41,1264 @@ DB_PATH.parent.mkdir(parents=True, exist_ok=True)
 _lock = threading.Lock()
 
 
-def _connect():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute(
-        "CREATE TABLE IF NOT EXISTS entries(id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, data TEXT, ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
-    )
-    conn.execute(
-        "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(kind, data, content='entries', content_rowid='id')"
+def _dumps(data: Dict[str, Any]) -> str:
+    """Canonical JSON for the ``data`` column; unknown types fall back to ``str``."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# Applied to every pooled connection. ``synchronous=NORMAL`` is durable
+# under WAL except for the last commits before a power loss.
+PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,  # negative = KiB, ~16 MB page cache
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+JSON_BATCH = 1000
+
+
+def _json_column(name: str) -> str:
+    # Guarded so a stray non-JSON row reads as NULL instead of raising.
+    return (
+        f"ALTER TABLE entries ADD COLUMN {name} TEXT GENERATED ALWAYS AS "
+        f"(CASE WHEN json_valid(data) THEN json_extract(data, '$.{name}') END) VIRTUAL"
     )
-    conn.execute(
-        "CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN INSERT INTO entries_fts(rowid, kind, data) VALUES (new.id, new.kind, new.data); END;"
+
+
+def _backfill_json(conn: sqlite3.Connection) -> None:
+    """Rewrite legacy ``str(dict)`` payloads as JSON, one batch per commit."""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, kind, data FROM entries WHERE id > ? AND NOT json_valid(data) ORDER BY id LIMIT ?",
+            (last_id, JSON_BATCH),
+        ).fetchall()
+        if not rows:
+            return
+        with conn:
+            for entry_id, kind, old in rows:
+                try:
+                    value = ast.literal_eval(old)
+                except (ValueError, SyntaxError, MemoryError, RecursionError):
+                    value = None
+                if not isinstance(value, dict):
+                    value = {"kind": kind, "raw": old}
+                new = _dumps(value)
+                conn.execute("UPDATE entries SET data=? WHERE id=?", (new, entry_id))
+                conn.execute(
+                    "INSERT INTO entries_fts(entries_fts, rowid, kind, data) VALUES('delete', ?, ?, ?)",
+                    (entry_id, kind, old),
+                )
+                conn.execute(
+                    "INSERT INTO entries_fts(rowid, kind, data) VALUES(?, ?, ?)", (entry_id, kind, new)
+                )
+        last_id = rows[-1][0]
+
+
+def _move_chunk_texts(conn: sqlite3.Connection) -> None:
+    """Move inline ``kb_chunk`` texts into the chunk store, one batch per commit."""
+    while True:
+        rows = conn.execute(
+            "SELECT id, json_extract(data, '$.text') FROM entries "
+            "WHERE kind = 'kb_chunk' AND json_extract(data, '$.text') IS NOT NULL LIMIT ?",
+            (JSON_BATCH,),
+        ).fetchall()
+        if not rows:
+            return
+        with conn:
+            for entry_id, text in rows:
+                digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                conn.execute("INSERT OR IGNORE INTO chunks(hash, text) VALUES (?, ?)", (digest, text))
+                conn.execute(
+                    "UPDATE entries SET data = json_set(json_remove(data, '$.text'), '$.sha256', ?) WHERE id = ?",
+                    (digest, entry_id),
+                )
+
+
+Migration = Union[List[str], Callable[[sqlite3.Connection], None]]
+
+# Schema migrations; ``user_version`` records how many have been applied.
+# SQL steps run in one transaction; callables manage their own commits and
+# must be idempotent, since a crash re-runs them from the start.
+MIGRATIONS: List[Migration] = [
+    [
+        "CREATE TABLE IF NOT EXISTS entries(id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, data TEXT, ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(kind, data, content='entries', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN INSERT INTO entries_fts(rowid, kind, data) VALUES (new.id, new.kind, new.data); END;",
+    ],
+    [
+        _json_column("role"),
+        _json_column("topic"),
+        _json_column("sender"),
+        "CREATE INDEX IF NOT EXISTS idx_entries_kind ON entries(kind)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_ts ON entries(ts)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_role ON entries(role)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_topic ON entries(topic)",
+        "CREATE INDEX IF NOT EXISTS idx_entries_sender ON entries(sender)",
+    ],
+    _backfill_json,
+    [
+        "CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN INSERT INTO entries_fts(entries_fts, rowid, kind, data) VALUES ('delete', old.id, old.kind, old.data); END;",
+        "CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE OF kind, data ON entries BEGIN INSERT INTO entries_fts(entries_fts, rowid, kind, data) VALUES ('delete', old.id, old.kind, old.data); INSERT INTO entries_fts(rowid, kind, data) VALUES (new.id, new.kind, new.data); END;",
+    ],
+    [
+        # Embeddings of kb_chunk entries, one row per (entry, embedder); see kb_vector.
+        "CREATE TABLE IF NOT EXISTS chunk_embeddings(embedder TEXT NOT NULL, entry_id INTEGER NOT NULL, embedding BLOB NOT NULL, PRIMARY KEY(entry_id, embedder)) WITHOUT ROWID",
+        "CREATE TRIGGER IF NOT EXISTS entries_ad_vec AFTER DELETE ON entries WHEN old.kind = 'kb_chunk' BEGIN DELETE FROM chunk_embeddings WHERE entry_id = old.id; END;",
+    ],
+    [
+        # Content-addressed chunk store: kb_chunk entries reference text by sha256.
+        "CREATE TABLE IF NOT EXISTS chunks(id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, text TEXT NOT NULL)",
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(text, content='chunks', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN INSERT INTO chunks_fts(rowid, text) VALUES (new.id, new.text); END;",
+        "CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN INSERT INTO chunks_fts(chunks_fts, rowid, text) VALUES ('delete', old.id, old.text); END;",
+        _json_column("sha256"),
+        "CREATE INDEX IF NOT EXISTS idx_entries_sha256 ON entries(sha256)",
+    ],
+    _move_chunk_texts,
+    [
+        # Monthly archive segments; see archive().
+        "CREATE TABLE IF NOT EXISTS partitions(month TEXT PRIMARY KEY, file TEXT NOT NULL, min_id INTEGER, max_id INTEGER, min_ts TEXT, max_ts TEXT, rows INTEGER, bytes INTEGER)",
+    ],
+    [
+        # Materialized weekly report sections; see kb_report.
+        "CREATE TABLE IF NOT EXISTS report_weeks(week TEXT PRIMARY KEY, max_id INTEGER NOT NULL, complete INTEGER NOT NULL, counts TEXT NOT NULL, generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)",
+        "CREATE TABLE IF NOT EXISTS report_rows(week TEXT NOT NULL, section TEXT NOT NULL, entry_id INTEGER NOT NULL, line TEXT NOT NULL, PRIMARY KEY(week, section, entry_id)) WITHOUT ROWID",
+    ],
+    [
+        # Bumped whenever existing rows change or disappear; inserts are
+        # tracked by max(id). Together they validate the read cache.
+        "CREATE TABLE IF NOT EXISTS kb_meta(key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO kb_meta(key, value) VALUES ('generation', 0)",
+        "CREATE TRIGGER IF NOT EXISTS entries_ad_gen AFTER DELETE ON entries BEGIN UPDATE kb_meta SET value = value + 1 WHERE key = 'generation'; END;",
+        "CREATE TRIGGER IF NOT EXISTS entries_au_gen AFTER UPDATE ON entries BEGIN UPDATE kb_meta SET value = value + 1 WHERE key = 'generation'; END;",
+        "CREATE TRIGGER IF NOT EXISTS partitions_ai_gen AFTER INSERT ON partitions BEGIN UPDATE kb_meta SET value = value + 1 WHERE key = 'generation'; END;",
+        "CREATE TRIGGER IF NOT EXISTS partitions_ad_gen AFTER DELETE ON partitions BEGIN UPDATE kb_meta SET value = value + 1 WHERE key = 'generation'; END;",
+    ],
+]
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    while True:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(MIGRATIONS):
+            return
+        step = MIGRATIONS[version]
+        if callable(step):
+            step(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-check under the write lock: another process may have migrated.
+            if conn.execute("PRAGMA user_version").fetchone()[0] == version:
+                if not callable(step):
+                    for stmt in step:
+                        conn.execute(stmt)
+                conn.execute(f"PRAGMA user_version={version + 1}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def _prepare(conn: sqlite3.Connection) -> None:
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    _migrate(conn)
+
+
+class ConnectionManager:
+    """Hand out one prepared connection per (thread, database file)."""
+
+    def __init__(
+        self,
+        factory: Callable[..., sqlite3.Connection] = sqlite3.connect,
+        prepare: Optional[Callable[[sqlite3.Connection], None]] = None,
+    ):
+        self._factory = factory
+        self._prepare = prepare or _prepare
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._all_lock = threading.Lock()
+
+    def _open(self, path: Path) -> sqlite3.Connection:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Connections never leave their thread; ``check_same_thread`` is off
+        # only so :meth:`close_all` can close them at shutdown.
+        conn = self._factory(path, check_same_thread=False)
+        self._prepare(conn)
+        with self._all_lock:
+            self._all.append(conn)
+        return conn
+
+    def get(self, path: Path) -> sqlite3.Connection:
+        conns: Dict[str, sqlite3.Connection] | None = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        key = str(path)
+        conn = conns.get(key)
+        if conn is None:
+            conn = conns[key] = self._open(path)
+        return conn
+
+    def close_all(self) -> None:
+        """Close every pooled connection; threads reconnect lazily."""
+        with self._all_lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:  # pragma: no cover - already closed
+                pass
+        self._local = threading.local()
+
+
+pool = ConnectionManager()
+
+
+def _connect() -> sqlite3.Connection:
+    return pool.get(DB_PATH)
+
+
+def close() -> None:
+    """Close all pooled connections (tests, shutdown, file rotation)."""
+    pool.close_all()
+    segments.close_all()
+
+
+Row = Tuple[Optional[str], str]
+
+# Entry columns with chunk text re-inlined, so readers see the same payload
+# whether a kb_chunk row stores its text or references the chunk store.
+_ENTRY = (
+    "e.id, e.kind, CASE WHEN c.text IS NULL THEN e.data "
+    "ELSE json_set(e.data, '$.text', c.text) END, e.ts"
+)
+_FROM = "entries e LEFT JOIN chunks c ON c.hash = e.sha256"
+
+
+def _row(data: Dict[str, Any]) -> Row:
+    return (data.get("kind"), _dumps(data))
+
+
+def _insert_rows(rows: List[Row]) -> None:
+    conn = _connect()
+    with conn:
+        conn.executemany("INSERT INTO entries(kind,data) VALUES(?,?)", rows)
+    _notify()
+
+
+# Wakes tail() readers in this process after each commit. Writers in other
+# processes are picked up by tail()'s backoff re-check instead.
+_changes = threading.Condition()
+_change_seq = 0
+
+
+def _notify() -> None:
+    global _change_seq
+    with _changes:
+        _change_seq += 1
+        _changes.notify_all()
+
+
+class WriteBehind:
+    """Queue entries in memory and commit them in groups.
+
+    A daemon thread flushes the queue in one ``executemany`` transaction
+    every ``interval_ms`` milliseconds, or as soon as ``max_batch`` rows are
+    waiting. :meth:`flush` drains synchronously; both paths hold the module
+    write lock while popping and writing, so once :meth:`flush` returns every
+    row queued before the call is committed.
+    """
+
+    def __init__(self, interval_ms: int = 50, max_batch: int = 500):
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue: Deque[Row] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.enqueued = 0
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._thread = threading.Thread(target=self._run, name="kb-write-behind", daemon=True)
+        self._thread.start()
+
+    def put(self, row: Row) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            self._queue.append(row)
+            self.enqueued += 1
+            depth = len(self._queue)
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+            if depth >= self.max_batch:
+                self._cond.notify()
+
+    def _drain_once(self) -> int:
+        with _lock:
+            with self._cond:
+                n = min(len(self._queue), self.max_batch)
+                batch = [self._queue.popleft() for _ in range(n)]
+            if not batch:
+                return 0
+            start = time.perf_counter()
+            try:
+                _insert_rows(batch)
+            except sqlite3.Error:
+                with self._cond:
+                    self._queue.extendleft(reversed(batch))
+                self.errors += 1
+                raise
+            ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_ms = ms
+            self.max_flush_ms = max(self.max_flush_ms, ms)
+            self._total_flush_ms += ms
+        return len(batch)
+
+    def flush(self) -> int:
+        """Commit everything queued so far; return the number of rows written."""
+        written = 0
+        while True:
+            n = self._drain_once()
+            if not n:
+                return written
+            written += n
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.max_batch:
+                    self._cond.wait(self.interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Rows stay queued; retry on the next tick.
+                time.sleep(self.interval)
+
+    def close(self) -> None:
+        """Stop the writer thread and commit whatever is still queued."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = len(self._queue)
+        return {
+            "queue_depth": depth,
+            "max_queue_depth": self.max_queue_depth,
+            "enqueued": self.enqueued,
+            "flushed_rows": self.flushed_rows,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            "max_flush_ms": round(self.max_flush_ms, 3),
+        }
+
+
+_writer: Optional[WriteBehind] = None
+
+
+def enable_write_behind(interval_ms: int = 50, max_batch: int = 500) -> WriteBehind:
+    """Route :func:`add_entry` through a group-commit queue."""
+    global _writer
+    disable_write_behind()
+    _writer = WriteBehind(interval_ms=interval_ms, max_batch=max_batch)
+    return _writer
+
+
+def disable_write_behind() -> None:
+    """Flush pending rows and return to synchronous writes."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def flush() -> int:
+    """Commit any queued write-behind rows. No-op in synchronous mode."""
+    return _writer.flush() if _writer is not None else 0
+
+
+def write_behind_stats() -> Dict[str, Any]:
+    """Queue depth and flush latency metrics; empty in synchronous mode."""
+    return _writer.stats() if _writer is not None else {}
+
+
+atexit.register(disable_write_behind)
+
+if os.environ.get("KB_WRITE_BEHIND", "").lower() in ("1", "true", "yes"):
+    enable_write_behind(
+        interval_ms=int(os.environ.get("KB_FLUSH_MS", 50)),
+        max_batch=int(os.environ.get("KB_FLUSH_ROWS", 500)),
     )
-    return conn
 
 
 def add_entry(**data: Any):
+    row = _row(data)
+    if _writer is not None:
+        _writer.put(row)
+        return
     with _lock:
-        conn = _connect()
-        conn.execute("INSERT INTO entries(kind,data) VALUES(?,?)", (data.get("kind"), str(data)))
-        conn.commit()
-        conn.close()
+        _insert_rows([row])
+
+
+def add_entries(entries: Iterable[Dict[str, Any]]) -> None:
+    """Store several entries in one transaction (or one write-behind batch)."""
+    rows = [_row(data) for data in entries]
+    if not rows:
+        return
+    if _writer is not None:
+        for row in rows:
+            _writer.put(row)
+        return
+    with _lock:
+        _insert_rows(rows)
+
+
+# -- Monthly archive segments ------------------------------------------------
+#
+# archive() moves whole months out of the hot database into one SQLite file
+# per month, with the same schema, vacuumed and compressed (zstd when the
+# ``zstandard`` package is installed, gzip otherwise). The ``partitions``
+# table in the hot database is the manifest. Readers decompress a segment
+# once into ``<archive>/.cache`` and open it read-only and immutable.
+
+
+def _archive_dir() -> Path:
+    return DB_PATH.with_name(DB_PATH.stem + "_archive")
+
+
+def _open_segment(path: Path, **kwargs: Any) -> sqlite3.Connection:
+    return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro&immutable=1", uri=True, **kwargs)
+
+
+segments = ConnectionManager(factory=_open_segment, prepare=lambda conn: None)
+
+
+def _partitions(since: "datetime | str | None" = None, until: "datetime | str | None" = None) -> List[dict]:
+    """Manifest rows overlapping ``[since, until)``, newest month first."""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append("max_ts >= ?")
+        params.append(_ts(since))
+    if until is not None:
+        clauses.append("min_ts < ?")
+        params.append(_ts(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    cur = _connect().execute(f"SELECT * FROM partitions {where} ORDER BY month DESC", params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur.fetchall()]
+
+
+def _decompress(src: Path, dest: Path) -> None:
+    tmp = dest.with_name(dest.name + ".tmp")
+    if src.suffix == ".zst":
+        import zstandard  # type: ignore
+
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            zstandard.ZstdDecompressor().copy_stream(fin, fout)
+    else:
+        with gzip.open(src, "rb") as fin, open(tmp, "wb") as fout:
+            shutil.copyfileobj(fin, fout)
+    os.replace(tmp, dest)
+
+
+def _compress(src: Path, month: str) -> Path:
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        zstandard = None  # type: ignore[assignment]
+    dest = _archive_dir() / f"{month}.db.{'zst' if zstandard else 'gz'}"
+    tmp = dest.with_name(dest.name + ".tmp")
+    with open(src, "rb") as fin:
+        if zstandard is not None:
+            with open(tmp, "wb") as fout:
+                zstandard.ZstdCompressor(level=10).copy_stream(fin, fout)
+        else:
+            with gzip.open(tmp, "wb", compresslevel=6) as fout:
+                shutil.copyfileobj(fin, fout)
+    os.replace(tmp, dest)
+    return dest
+
+
+def _segment(part: dict) -> sqlite3.Connection:
+    """Read-only connection to an archived month, decompressing it on first use."""
+    # The cache name changes whenever the segment is rewritten.
+    cached = _archive_dir() / ".cache" / f"{part['month']}-{part['max_id']}-{part['bytes']}.db"
+    if not cached.exists():
+        with _lock:
+            if not cached.exists():
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                _decompress(_archive_dir() / part["file"], cached)
+    return segments.get(cached)
+
+
+def _newest_first(
+    sql: str,
+    params: List[Any],
+    limit: int,
+    since: "datetime | str | None" = None,
+    until: "datetime | str | None" = None,
+) -> List[tuple]:
+    """Run an ``id DESC`` query on the hot database and on archived months
+    inside ``[since, until)``; return the newest ``limit`` rows overall.
+
+    Hot rows are not all newer than archived ones (``kb_chunk`` rows stay
+    hot), so results are merged by id. A month is skipped once ``limit``
+    rows newer than its ``max_id`` are in hand.
+    """
+    if limit <= 0:
+        return []
+    rows = _connect().execute(sql, (*params, limit)).fetchall()
+    for part in sorted(_partitions(since, until), key=lambda p: p["max_id"], reverse=True):
+        if len(rows) >= limit and part["max_id"] < rows[limit - 1][0]:
+            break
+        older = _segment(part).execute(sql, (*params, limit)).fetchall()
+        rows = list(itertools.islice(heapq.merge(rows, older, key=lambda r: -r[0]), limit))
+    return rows
+
+
+# -- Async facade ------------------------------------------------------------
+#
+# FastAPI handlers await these instead of calling the blocking functions on
+# the event loop. Writes go through one dedicated writer thread (SQLite has a
+# single writer anyway); reads use a small pool, each thread with its own
+# pooled connection.
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+READ_THREADS = 4
+
+
+def _executor(name: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            workers = 1 if name == "writer" else READ_THREADS
+            _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"kb-{name}")
+        return _executors[name]
+
+
+async def _run(name: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    return await asyncio.wrap_future(_executor(name).submit(fn, *args, **kwargs))
+
+
+async def aadd_entry(**data: Any) -> None:
+    """Non-blocking :func:`add_entry`; returns once the row is committed
+    (or queued, in write-behind mode)."""
+    if _writer is not None:
+        add_entry(**data)
+        return
+    await _run("writer", add_entry, **data)
+
+
+async def aadd_entries(entries: Iterable[Dict[str, Any]]) -> None:
+    """Non-blocking :func:`add_entries`."""
+    entries = list(entries)
+    if _writer is not None:
+        add_entries(entries)
+        return
+    await _run("writer", add_entries, entries)
+
 
+async def alast(n: int = 5) -> List[dict]:
+    return await _run("reader", last, n)
 
+
+async def aget(entry_id: int) -> dict:
+    return await _run("reader", get, entry_id)
+
+
+async def asearch(q: str, **kwargs: Any) -> List[dict]:
+    return await _run("reader", search, q, **kwargs)
+
+
+async def aquery(**kwargs: Any) -> List[dict]:
+    return await _run("reader", query, **kwargs)
+
+
+# -- Read cache --------------------------------------------------------------
+#
+# last(), search() and query() results are kept in an in-process LRU keyed by
+# the normalized call. An entry is valid while max(entries.id) and the
+# ``generation`` counter are unchanged, so a hit costs one indexed lookup.
+
+CACHE_SIZE = int(os.environ.get("KB_CACHE_SIZE", 256))
+
+
+class ReadCache:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data: "OrderedDict[tuple, Tuple[tuple, List[dict]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: tuple) -> Optional[List[dict]]:
+        with self._lock:
+            found = self._data.get(key)
+            if found is not None and found[0] == version:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return [dict(r) for r in found[1]]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, version: tuple, rows: List[dict]) -> None:
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._data[key] = (version, [dict(r) for r in rows])
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "capacity": self.capacity}
+
+
+read_cache = ReadCache(CACHE_SIZE)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and occupancy of the read cache."""
+    return read_cache.stats()
+
+
+def _version() -> tuple:
+    return _connect().execute(
+        "SELECT (SELECT max(id) FROM entries), (SELECT value FROM kb_meta WHERE key = 'generation')"
+    ).fetchone()
+
+
+def _normalize(name: str, value: Any) -> Any:
+    if isinstance(value, datetime):
+        return _ts(value)
+    if name == "q":
+        return " ".join(value.split())
+    if name == "kinds" and value is not None:
+        return tuple(sorted(value))
+    if isinstance(value, (list, dict, set)):
+        return repr(value)
+    return value
+
+
+def _cached(fn: Callable[..., List[dict]]) -> Callable[..., List[dict]]:
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> List[dict]:
+        if read_cache.capacity <= 0:
+            return fn(*args, **kwargs)
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        if bound.arguments.get("kinds") is not None:
+            # Read an iterator once, for both the key and the query.
+            bound.arguments["kinds"] = list(bound.arguments["kinds"])
+        key = (str(DB_PATH), fn.__name__) + tuple(
+            (name, _normalize(name, value)) for name, value in bound.arguments.items()
+        )
+        version = _version()
+        rows = read_cache.get(key, version)
+        if rows is None:
+            rows = fn(*bound.args, **bound.kwargs)
+            read_cache.put(key, version, rows)
+        return rows
+
+    return wrapper
+
+
+@_cached
 def last(n: int = 5) -> List[dict]:
-    conn = _connect()
-    rows = conn.execute("SELECT id, kind, data, ts FROM entries ORDER BY id DESC LIMIT ?", (n,)).fetchall()
-    conn.close()
+    rows = _newest_first(f"SELECT {_ENTRY} FROM {_FROM} ORDER BY e.id DESC LIMIT ?", [], n)
     return [dict(id=r[0], kind=r[1], data=r[2], ts=r[3]) for r in rows]
 
 
-def search(q: str) -> List[dict]:
+def _ts(value: "datetime | str") -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if isinstance(value, datetime) else value
+
+
+SNIPPET_MARKERS = ("**", "**")
+
+
+@_cached
+def search(
+    q: str,
+    limit: int = 50,
+    offset: int = 0,
+    kinds: Optional[Iterable[str]] = None,
+    since: "datetime | str | None" = None,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[dict]:
+    """Full-text search ranked by bm25, best match first.
+
+    Each row carries a ``snippet`` with matches wrapped in
+    :data:`SNIPPET_MARKERS` and its ``rank``. Page with ``offset`` or, for
+    deep pages, pass ``after=(row["rank"], row["id"])`` from the last row of
+    the previous page (keyset pagination).
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    kinds = list(kinds) if kinds is not None else None
+    if kinds is not None:
+        clauses.append(f"e.kind IN ({','.join('?' * len(kinds))})")
+        params.extend(kinds)
+    if since is not None:
+        clauses.append("e.ts >= ?")
+        params.append(_ts(since))
+    if after is not None:
+        clauses.append("(h.rank > ? OR (h.rank = ? AND e.id > ?))")
+        params.extend([after[0], after[0], after[1]])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    open_mark, close_mark = SNIPPET_MARKERS
+    # Entry payloads and stored chunk texts are indexed separately; a chunk
+    # hit is reported once per kb_chunk entry referencing it.
+    sql = (
+        f"SELECT {_ENTRY}, h.rank, h.snippet FROM ("
+        "SELECT entries_fts.rowid AS id, entries_fts.rank AS rank, "
+        "snippet(entries_fts, 1, ?, ?, '...', 16) AS snippet "
+        "FROM entries_fts WHERE entries_fts MATCH ? "
+        "UNION ALL "
+        "SELECT r.id, chunks_fts.rank, snippet(chunks_fts, 0, ?, ?, '...', 16) "
+        "FROM chunks_fts JOIN chunks s ON s.id = chunks_fts.rowid "
+        "JOIN entries r ON r.sha256 = s.hash WHERE chunks_fts MATCH ?"
+        ") h JOIN entries e ON e.id = h.id LEFT JOIN chunks c ON c.hash = e.sha256 "
+        f"{where} ORDER BY h.rank, e.id LIMIT ? OFFSET ?"
+    )
+    args = (open_mark, close_mark, q, open_mark, close_mark, q, *params)
+    # Archived months are only searched when ``since`` reaches back into them.
+    parts = _partitions(since) if since is not None else []
+    if not parts:
+        rows = _connect().execute(sql, (*args, limit, offset)).fetchall()
+    else:
+        rows = _connect().execute(sql, (*args, limit + offset, 0)).fetchall()
+        for part in parts:
+            rows += _segment(part).execute(sql, (*args, limit + offset, 0)).fetchall()
+        rows = sorted(rows, key=lambda r: (r[4], r[0]))[offset:offset + limit]
+    return [dict(id=r[0], kind=r[1], data=r[2], ts=r[3], rank=r[4], snippet=r[5]) for r in rows]
+
+
+TAIL_MIN_WAIT = 0.05
+TAIL_MAX_WAIT = 1.0
+
+
+def tail(
+    since_id: Optional[int] = None,
+    kinds: Optional[Iterable[str]] = None,
+    batch: int = 100,
+    heartbeat: Optional[float] = None,
+) -> Iterator[Optional[dict]]:
+    """Follow new entries in id order, forever.
+
+    Starts after ``since_id``; ``None`` means after the newest entry. When
+    idle it sleeps on a condition that local writes signal. Other processes'
+    writes are found by a re-check whose interval backs off from
+    :data:`TAIL_MIN_WAIT` to :data:`TAIL_MAX_WAIT`. With ``heartbeat`` set,
+    ``None`` is yielded after that many idle seconds, so stream consumers
+    can send keepalives or notice a closed client.
+    """
+    kinds = list(kinds) if kinds is not None else None
+    kind_clause = f" AND e.kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+    sql = f"SELECT {_ENTRY} FROM {_FROM} WHERE e.id > ? AND e.id <= ?{kind_clause} ORDER BY e.id LIMIT ?"
     conn = _connect()
-    rows = conn.execute("SELECT rowid, kind, data FROM entries_fts WHERE entries_fts MATCH ?", (q,)).fetchall()
-    conn.close()
-    return [dict(id=r[0], kind=r[1], data=r[2]) for r in rows]
+    high = conn.execute("SELECT coalesce(max(id), 0) FROM entries").fetchone()[0]
+    cursor = high if since_id is None else since_id
+    delay = TAIL_MIN_WAIT
+    idle_since = time.monotonic()
+    while True:
+        with _changes:
+            seen = _change_seq
+        high = conn.execute("SELECT coalesce(max(id), 0) FROM entries").fetchone()[0]
+        found = False
+        while cursor < high:
+            rows = conn.execute(sql, (cursor, high, *(kinds or []), batch)).fetchall()
+            for r in rows:
+                yield dict(id=r[0], kind=r[1], data=r[2], ts=r[3])
+            found = found or bool(rows)
+            # Without a match the whole (cursor, high] range has been scanned.
+            cursor = rows[-1][0] if len(rows) == batch else high
+        if found:
+            delay, idle_since = TAIL_MIN_WAIT, time.monotonic()
+            continue
+        with _changes:
+            if _change_seq == seen:
+                _changes.wait(delay)
+            notified = _change_seq != seen
+        delay = TAIL_MIN_WAIT if notified else min(delay * 2, TAIL_MAX_WAIT)
+        if heartbeat is not None and time.monotonic() - idle_since >= heartbeat:
+            idle_since = time.monotonic()
+            yield None
+
+
+def _max_id() -> int:
+    return _connect().execute("SELECT coalesce(max(id), 0) FROM entries").fetchone()[0]
+
+
+def _tail_step(cursor: int, kinds: Optional[List[str]], batch: int) -> Tuple[List[tuple], int]:
+    """One bounded read for :func:`atail`: up to ``batch`` rows after ``cursor``."""
+    kind_clause = f" AND e.kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+    sql = f"SELECT {_ENTRY} FROM {_FROM} WHERE e.id > ? AND e.id <= ?{kind_clause} ORDER BY e.id LIMIT ?"
+    high = _max_id()
+    rows = _connect().execute(sql, (cursor, high, *(kinds or []), batch)).fetchall()
+    return rows, rows[-1][0] if len(rows) == batch else max(cursor, high)
+
+
+async def atail(
+    since_id: Optional[int] = None,
+    kinds: Optional[Iterable[str]] = None,
+    batch: int = 100,
+    heartbeat: Optional[float] = None,
+) -> AsyncIterator[Optional[dict]]:
+    """Async :func:`tail` for event-loop consumers.
+
+    Each read is a short query on the reader pool, so a follower never holds
+    a thread while idle. Waits happen on the event loop: local writes are
+    noticed within :data:`TAIL_MIN_WAIT`, other processes' writes by the
+    same backoff as :func:`tail`.
+    """
+    kinds = list(kinds) if kinds is not None else None
+    cursor = since_id
+    if cursor is None:
+        cursor = await _run("reader", _max_id)
+    delay = TAIL_MIN_WAIT
+    idle_since = time.monotonic()
+    while True:
+        seen = _change_seq
+        rows, cursor = await _run("reader", _tail_step, cursor, kinds, batch)
+        for r in rows:
+            yield dict(id=r[0], kind=r[1], data=r[2], ts=r[3])
+        if rows:
+            delay, idle_since = TAIL_MIN_WAIT, time.monotonic()
+            continue
+        waited = 0.0
+        while waited < delay and _change_seq == seen:
+            await asyncio.sleep(TAIL_MIN_WAIT)
+            waited += TAIL_MIN_WAIT
+        delay = TAIL_MIN_WAIT if _change_seq != seen else min(delay * 2, TAIL_MAX_WAIT)
+        if heartbeat is not None and time.monotonic() - idle_since >= heartbeat:
+            idle_since = time.monotonic()
+            yield None
+
+
+def prune(before: "datetime | str", kinds: Optional[Iterable[str]] = None, batch: int = 1000) -> int:
+    """Delete entries older than ``before`` in batches; return rows removed."""
+    clauses = ["ts < ?"]
+    params: List[Any] = [_ts(before)]
+    if kinds is not None:
+        kinds = list(kinds)
+        clauses.append(f"kind IN ({','.join('?' * len(kinds))})")
+        params.extend(kinds)
+    removed = 0
+    while True:
+        with _lock:
+            conn = _connect()
+            with conn:
+                n = conn.execute(
+                    f"DELETE FROM entries WHERE id IN (SELECT id FROM entries WHERE {' AND '.join(clauses)} LIMIT ?)",
+                    (*params, batch),
+                ).rowcount
+        removed += n
+        if n < batch:
+            break
+    if kinds is None or "kb_chunk" in kinds:
+        gc_chunks()
+    return removed
+
+
+def gc_chunks() -> int:
+    """Drop stored chunk texts no entry references any more."""
+    with _lock:
+        conn = _connect()
+        with conn:
+            return conn.execute(
+                "DELETE FROM chunks WHERE NOT EXISTS (SELECT 1 FROM entries WHERE sha256 = chunks.hash)"
+            ).rowcount
+
+
+def _month_start(value: "datetime | str") -> str:
+    return _ts(value)[:7] + "-01 00:00:00"
+
+
+def _next_month(month: str) -> str:
+    year, mon = int(month[:4]), int(month[5:7])
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}-01 00:00:00"
+
+
+def archive(before: "datetime | str | None" = None, keep_kinds: Iterable[str] = ("kb_chunk",)) -> List[dict]:
+    """Move whole months older than ``before`` into compressed segments.
+
+    ``before`` defaults to the current month, so only finished months move.
+    ``keep_kinds`` stay hot: ``kb_chunk`` rows are knowledge, not events.
+    Re-running is safe. Rows are copied into the segment before the hot copy
+    is deleted, and a month that already has a segment is extended.
+    Returns the manifest rows written.
+    """
+    flush()
+    cutoff = _month_start(before or datetime.utcnow())
+    keep = list(keep_kinds)
+    not_kept = f"kind NOT IN ({','.join('?' * len(keep))})" if keep else "1"
+    conn = _connect()
+    months = [
+        r[0]
+        for r in conn.execute(
+            f"SELECT DISTINCT substr(ts, 1, 7) FROM entries WHERE ts < ? AND {not_kept} ORDER BY 1",
+            (cutoff, *keep),
+        )
+    ]
+    directory = _archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    written = []
+    for month in months:
+        start, end = f"{month}-01 00:00:00", _next_month(month)
+        work = directory / f"{month}.db"
+        work.unlink(missing_ok=True)
+        existing = conn.execute("SELECT file FROM partitions WHERE month = ?", (month,)).fetchone()
+        if existing:
+            _decompress(directory / existing[0], work)
+        seg = sqlite3.connect(work)
+        _prepare(seg)
+        seg.close()
+        with _lock:
+            conn.execute("ATTACH DATABASE ? AS seg", (str(work),))
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO seg.entries(id, kind, data, ts) SELECT id, kind, data, ts "
+                        f"FROM main.entries WHERE ts >= ? AND ts < ? AND {not_kept}",
+                        (start, end, *keep),
+                    )
+            finally:
+                conn.execute("DETACH DATABASE seg")
+        seg = sqlite3.connect(work)
+        seg.execute("PRAGMA journal_mode=DELETE")
+        seg.execute("VACUUM")
+        stats = seg.execute("SELECT min(id), max(id), min(ts), max(ts), count(*) FROM entries").fetchone()
+        seg.close()
+        dest = _compress(work, month)
+        work.unlink()
+        if existing and existing[0] != dest.name:
+            (directory / existing[0]).unlink(missing_ok=True)
+        part = dict(
+            month=month, file=dest.name, min_id=stats[0], max_id=stats[1],
+            min_ts=stats[2], max_ts=stats[3], rows=stats[4], bytes=dest.stat().st_size,
+        )
+        with _lock:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO partitions VALUES "
+                    "(:month, :file, :min_id, :max_id, :min_ts, :max_ts, :rows, :bytes)",
+                    part,
+                )
+        while True:
+            with _lock:
+                with conn:
+                    n = conn.execute(
+                        "DELETE FROM entries WHERE id IN (SELECT id FROM entries "
+                        f"WHERE ts >= ? AND ts < ? AND {not_kept} LIMIT ?)",
+                        (start, end, *keep, JSON_BATCH),
+                    ).rowcount
+            if n < JSON_BATCH:
+                break
+        written.append(part)
+    return written
+
+
+def drop_partitions(before: "datetime | str") -> List[str]:
+    """Retention: delete archived months older than ``before``; return them."""
+    cutoff = _month_start(before)[:7]
+    conn = _connect()
+    months = [r[0] for r in conn.execute("SELECT month FROM partitions WHERE month < ?", (cutoff,))]
+    directory = _archive_dir()
+    segments.close_all()
+    for month in months:
+        with _lock:
+            with conn:
+                (file,) = conn.execute("SELECT file FROM partitions WHERE month = ?", (month,)).fetchone()
+                conn.execute("DELETE FROM partitions WHERE month = ?", (month,))
+        (directory / file).unlink(missing_ok=True)
+        for cached in (directory / ".cache").glob(f"{month}-*.db"):
+            cached.unlink(missing_ok=True)
+    return months
+
+
+# -- Backups and snapshot reads ------------------------------------------------
+
+
+def _backup_dir() -> Path:
+    return DB_PATH.with_name(DB_PATH.stem + "_backups")
+
+
+def snapshot(
+    dest: "Path | str | None" = None,
+    *,
+    progress: Optional[Callable[[int, int, int], None]] = None,
+) -> Path:
+    """Copy the live database to ``dest`` with SQLite's online backup API.
+
+    The copy is one step inside a WAL read transaction, so writers keep
+    committing while it runs. (A stepped backup restarts whenever another
+    connection commits and never finishes on a busy KB.) It is written next
+    to ``dest`` and renamed into place once complete.
+    """
+    flush()
+    _connect()
+    dest = Path(dest) if dest else _backup_dir() / f"{DB_PATH.stem}-{datetime.utcnow():%Y%m%d-%H%M%S}.db"
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    part.unlink(missing_ok=True)
+    src = sqlite3.connect(DB_PATH)
+    dst = sqlite3.connect(part)
+    try:
+        src.backup(dst, pages=-1, progress=progress)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(part, dest)
+    return dest
+
+
+@contextmanager
+def snapshot_reader(path: "Path | str | None" = None) -> Iterator[sqlite3.Connection]:
+    """Read-only connection pinned to one consistent view of the KB.
+
+    Against the live database the view is a WAL read transaction: inserts
+    keep committing, but are invisible until the block exits. ``path`` reads
+    a file written by :func:`snapshot` instead.
+    """
+    if path is None:
+        _connect()
+    target = Path(path) if path else DB_PATH
+    conn = sqlite3.connect(f"{target.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM entries LIMIT 1").fetchall()
+        yield conn
+    finally:
+        conn.close()
+
+
+INGEST_SUFFIXES = (".md", ".txt", ".rst")
+
+# (source, path, text, max_tokens, overlap_tokens); exactly one of path/text is set.
+_Job = Tuple[Optional[str], Optional[str], Optional[str], int, int]
+
+
+def _chunk_document(job: _Job) -> Tuple[Optional[str], int, List[Tuple[str, str]]]:
+    """Read and chunk one document; runs inside ingest worker processes."""
+    source, path, text, max_tokens, overlap_tokens = job
+    if path is not None:
+        text = Path(path).read_text(encoding="utf-8", errors="replace")
+    chunks = DynamicChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens).chunk(text or "")
+    digests = [(hashlib.sha256(c.encode("utf-8")).hexdigest(), c) for c in chunks]
+    return source, len((text or "").encode("utf-8")), digests
+
+
+def _expand(items: Iterable["str | Path"]) -> Iterator[Tuple[Optional[str], Optional[str], Optional[str]]]:
+    """Yield ``(source, path, text)``; only ``Path`` items are read from disk."""
+    for item in items:
+        if isinstance(item, Path):
+            path = item
+            if path.is_dir():
+                for child in sorted(path.rglob("*")):
+                    if child.is_file() and child.suffix.lower() in INGEST_SUFFIXES:
+                        yield str(child), str(child), None
+            else:
+                yield str(path), str(path), None
+        else:
+            yield None, None, str(item)
+
+
+def ingest_many(
+    items: Iterable["str | Path"],
+    meta: Dict[str, Any] | None = None,
+    workers: int = 1,
+    max_tokens: int = 800,
+    overlap_tokens: int = 80,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Chunk and store many documents.
+
+    ``items`` mixes raw texts (``str``) with files and directories given as
+    ``Path`` objects (directories are searched for :data:`INGEST_SUFFIXES`).
+    A string is always stored as text, never opened. With ``workers > 1`` documents are read and
+    chunked in a process pool. Chunk texts are stored once in the ``chunks``
+    table, keyed by sha256; ``kb_chunk`` entries only reference them, and a
+    reference identical to an existing one (same chunk, index and meta) is
+    skipped, so re-ingesting an unchanged corpus writes nothing. Each
+    document is written in a single transaction. ``progress`` receives the
+    running stats after every document.
+    """
+    jobs = [(src, path, text, max_tokens, overlap_tokens) for src, path, text in _expand(items)]
+    return _ingest(jobs, meta, workers, progress)
+
+
+def _ingest(
+    jobs: List[_Job],
+    meta: Dict[str, Any] | None,
+    workers: int,
+    progress: Optional[Callable[[Dict[str, Any]], None]],
+) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {"documents": 0, "chunks": 0, "stored": 0, "duplicates": 0, "skipped": 0, "bytes": 0}
+    start = time.perf_counter()
+
+    def store(results: Iterable[Tuple[Optional[str], int, List[Tuple[str, str]]]]) -> None:
+        for source, size, digests in results:
+            doc_meta = dict(meta or {})
+            if source is not None:
+                doc_meta["source"] = source
+            meta_json = _dumps(doc_meta)
+            rows: List[Row] = []
+            with _lock:
+                conn = _connect()
+                with conn:
+                    for idx, (digest, chunk) in enumerate(digests):
+                        if conn.execute(
+                            "INSERT OR IGNORE INTO chunks(hash, text) VALUES (?, ?)", (digest, chunk)
+                        ).rowcount:
+                            stats["stored"] += 1
+                        else:
+                            stats["duplicates"] += 1
+                            if conn.execute(
+                                "SELECT 1 FROM entries WHERE sha256 = ? AND kind = 'kb_chunk' "
+                                "AND json_extract(data, '$.chunk_index') = ? AND json_extract(data, '$.meta') = ? LIMIT 1",
+                                (digest, idx, meta_json),
+                            ).fetchone():
+                                stats["skipped"] += 1
+                                continue
+                        rows.append(_row(dict(kind="kb_chunk", chunk_index=idx, sha256=digest, meta=doc_meta)))
+                    conn.executemany("INSERT INTO entries(kind,data) VALUES(?,?)", rows)
+            if rows:
+                _notify()
+            stats["documents"] += 1
+            stats["chunks"] += len(rows)
+            stats["bytes"] += size
+            elapsed = time.perf_counter() - start
+            stats["seconds"] = round(elapsed, 3)
+            stats["chunks_per_sec"] = round(stats["chunks"] / elapsed, 1) if elapsed else 0.0
+            if progress is not None:
+                progress(dict(stats, total=len(jobs)))
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            store(executor.map(_chunk_document, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        store(map(_chunk_document, jobs))
+    return stats
 
 
 def ingest_text(text: str, meta: Dict[str, Any] | None = None) -> None:
     """Ingest long text using dynamic chunking and store each chunk."""
-    ch = DynamicChunker(max_tokens=800, overlap_tokens=80)
-    for idx, chunk in enumerate(ch.chunk(text)):
-        add_entry(kind="kb_chunk", chunk_index=idx, text=chunk, meta=meta or {})
+    _ingest([(None, None, text, 800, 80)], meta, 1, None)
+
+
+@_cached
+def query(
+    kind: Optional[str] = None,
+    role: Optional[str] = None,
+    topic: Optional[str] = None,
+    sender: Optional[str] = None,
+    since: "datetime | str | None" = None,
+    until: "datetime | str | None" = None,
+    limit: int = 100,
+) -> List[dict]:
+    """Newest-first entries matching indexed fields.
+
+    ``since`` is inclusive and ``until`` exclusive; both take a UTC
+    ``datetime`` or a ``YYYY-MM-DD HH:MM:SS`` string, like the ``ts`` column.
+    """
+    clauses: List[str] = []
+    params: List[Any] = []
+    for column, value in (("kind", kind), ("role", role), ("topic", topic), ("sender", sender)):
+        if value is not None:
+            clauses.append(f"e.{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("e.ts >= ?")
+        params.append(_ts(since))
+    if until is not None:
+        clauses.append("e.ts < ?")
+        params.append(_ts(until))
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = _newest_first(
+        f"SELECT {_ENTRY} FROM {_FROM} {where} ORDER BY e.id DESC LIMIT ?", params, limit, since, until
+    )
+    return [dict(id=r[0], kind=r[1], data=r[2], ts=r[3]) for r in rows]
 
 
 def get(entry_id: int) -> dict:
-    conn = _connect()
-    row = conn.execute("SELECT id, kind, data, ts FROM entries WHERE id=?", (entry_id,)).fetchone()
-    conn.close()
+    sql = f"SELECT {_ENTRY} FROM {_FROM} WHERE e.id=?"
+    row = _connect().execute(sql, (entry_id,)).fetchone()
+    if row is None:
+        for part in _partitions():
+            if part["min_id"] <= entry_id <= part["max_id"]:
+                row = _segment(part).execute(sql, (entry_id,)).fetchone()
+                break
     if row:
         return dict(id=row[0], kind=row[1], data=row[2], ts=row[3])
     return {}
+
+
+def _print_progress(stats: Dict[str, Any]) -> None:
+    print(
+        f"[kb] {stats['documents']}/{stats['total']} docs, {stats['chunks']} chunks "
+        f"({stats['stored']} new texts, {stats['skipped']} unchanged), {stats['chunks_per_sec']} chunks/s",
+        flush=True,
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(prog="kb.py", description="Knowledge base maintenance")
+    sub = ap.add_subparsers(dest="command", required=True)
+    ing = sub.add_parser("ingest", help="chunk and store documents from files or folders")
+    ing.add_argument("paths", nargs="+", type=Path)
+    ing.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ing.add_argument("--max-tokens", type=int, default=800)
+    ing.add_argument("--overlap-tokens", type=int, default=80)
+    arc = sub.add_parser("archive", help="move finished months into compressed segments")
+    arc.add_argument("--before", default=None, help="first month to keep hot, YYYY-MM (default: current)")
+    drop = sub.add_parser("drop", help="delete archived months older than --before")
+    drop.add_argument("--before", required=True, help="YYYY-MM")
+    bak = sub.add_parser("backup", help="online backup of the live database")
+    bak.add_argument("--out", type=Path, default=None, help="destination file (default: <db>_backups/)")
+    args = ap.parse_args(argv)
+
+    if args.command == "ingest":
+        stats = ingest_many(
+            args.paths,
+            workers=args.workers,
+            max_tokens=args.max_tokens,
+            overlap_tokens=args.overlap_tokens,
+            progress=_print_progress,
+        )
+        print(json.dumps(stats))
+    elif args.command == "archive":
+        for part in archive(args.before and f"{args.before}-01 00:00:00"):
+            print(json.dumps(part))
+    elif args.command == "drop":
+        print(json.dumps({"dropped": drop_partitions(f"{args.before}-01 00:00:00")}))
+    elif args.command == "backup":
+        print(snapshot(args.out))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Columnar export of knowledge-base entries for analytics.
+
+Entries are read in id order, in batches, from one pinned snapshot of the
+live database (archived months included). Each payload is parsed and
+flattened into one column per top-level key, and rows are written under
+``<out>/kind=<kind>/``. With pyarrow installed, each run writes one Parquet
+file per kind. A new file is started when a batch no longer fits the
+current schema. Without pyarrow, rows go to gzip-compressed NDJSON.
+
+``<out>/_state.json`` records the last exported id and the columns seen for
+each kind. The next run only reads newer rows; ``full=True`` starts over.
+The mark is shared by all kinds, so give a ``kinds``-filtered export its own
+output directory.
+"""
+
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import kb
+
+try:
+    import pyarrow as pa  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+except Exception:  # pragma: no cover
+    pa = None
+    pq = None
+
+FORMATS = ("parquet", "ndjson")
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _flatten(entry_id: int, kind: str, data: str, ts: Any) -> Dict[str, Any]:
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        payload = {"raw": data}
+    if not isinstance(payload, dict):
+        payload = {"value": payload}
+    row: Dict[str, Any] = {"id": entry_id, "ts": str(ts)}
+    for key, value in payload.items():
+        if key == "kind" and value == kind:
+            continue  # the partition directory already says it
+        if key in ("id", "ts", "kind"):
+            key = f"data_{key}"
+        # Nested values stay as JSON text so every column is a scalar.
+        row[key] = value if isinstance(value, _SCALARS) else kb._dumps(value)
+    return row
+
+
+def _rows(
+    source: sqlite3.Connection, from_sql: str, after: int, batch: int, kinds: Optional[Sequence[str]]
+) -> Iterator[tuple]:
+    """Yield ``(id, kind, data, ts)`` rows of one source with ``id > after``, in id order."""
+    kind_sql = f" AND e.kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+    entry_cols = kb._ENTRY if from_sql == kb._FROM else "e.id, e.kind, e.data, e.ts"
+    last = after
+    while True:
+        rows = source.execute(
+            f"SELECT {entry_cols} FROM {from_sql} WHERE e.id > ?{kind_sql} ORDER BY e.id LIMIT ?",
+            (last, *(kinds or ()), batch),
+        ).fetchall()
+        yield from rows
+        if len(rows) < batch:
+            return
+        last = rows[-1][0]
+
+
+def _batches(conn: sqlite3.Connection, after: int, batch: int, kinds: Optional[Sequence[str]]) -> Iterator[List[tuple]]:
+    """Yield ``(id, kind, data, ts)`` batches with ``id > after``, in id order.
+
+    Archived segments and the live database overlap in id range (``kb_chunk``
+    rows stay hot when older months are archived), so the sources are
+    merged by id rather than read one after another.
+    """
+    sources = [
+        _rows(kb._segment(part), "entries e", after, batch, kinds)
+        for part in kb._partitions()
+        if part["max_id"] > after
+    ]
+    sources.append(_rows(conn, kb._FROM, after, batch, kinds))
+    merged = heapq.merge(*sources, key=lambda row: row[0])
+    while True:
+        rows = list(itertools.islice(merged, batch))
+        if not rows:
+            return
+        yield rows
+
+
+def _load_state(out: Path) -> Dict[str, Any]:
+    path = out / "_state.json"
+    if not path.exists():
+        return {"last_id": 0, "schemas": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(out: Path, state: Dict[str, Any]) -> None:
+    tmp = out / "_state.json.tmp"
+    tmp.write_text(json.dumps(state, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, out / "_state.json")
+
+
+def _json_type(value: Any) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    return "null" if value is None else "string"
+
+
+class _ParquetSink:
+    """One Parquet writer per kind; rolls to a new file when the schema changes."""
+
+    suffix = ".parquet"
+
+    def __init__(self, directory: Path, stem: str):
+        self.directory = directory
+        self.stem = stem
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.schema = None
+        self.files: List[Path] = []
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        writer = self.writer
+        if writer is not None and self.schema is not None and set(self.schema.names) >= {k for r in rows for k in r}:
+            try:
+                table = pa.Table.from_pylist(rows, schema=self.schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+            else:
+                writer.write_table(table)
+                return
+        try:
+            table = pa.Table.from_pylist(rows)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed types under one key: fall back to text columns.
+            table = pa.Table.from_pylist(
+                [{k: v if k == "id" or v is None else str(v) for k, v in r.items()} for r in rows]
+            )
+        self.close()
+        path = self.directory / f"{self.stem}-{len(self.files)}{self.suffix}"
+        writer = self.writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+        self.schema = table.schema
+        self.files.append(path)
+        writer.write_table(table)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class _NdjsonSink:
+    suffix = ".ndjson.gz"
+
+    def __init__(self, directory: Path, stem: str):
+        path = directory / f"{stem}{self.suffix}"
+        self.handle = gzip.open(path, "wt", encoding="utf-8")
+        self.files = [path]
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        for row in rows:
+            self.handle.write(kb._dumps(row) + "\n")
+
+    def close(self) -> None:
+        self.handle.close()
+
+
+def export(
+    out: "Path | str" = Path("exports"),
+    *,
+    kinds: Optional[Sequence[str]] = None,
+    batch: int = 5000,
+    fmt: Optional[str] = None,
+    full: bool = False,
+) -> Dict[str, Any]:
+    """Export entries newer than the last run to ``out``; return run stats."""
+    fmt = fmt or ("parquet" if pa is not None else "ndjson")
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown export format {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("pyarrow is required for Parquet export")
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    state: Dict[str, Any] = {"last_id": 0, "schemas": {}} if full else _load_state(out)
+    start = state["last_id"]
+    sink_cls = _ParquetSink if fmt == "parquet" else _NdjsonSink
+    sinks: Dict[str, Any] = {}
+    rows_by_kind: Dict[str, int] = {}
+    last_id = start
+    try:
+        with kb.snapshot_reader() as snap:
+            for rows in _batches(snap, start, batch, kinds):
+                grouped: Dict[str, List[Dict[str, Any]]] = {}
+                for entry_id, kind, data, ts in rows:
+                    grouped.setdefault(kind or "none", []).append(_flatten(entry_id, kind, data, ts))
+                for kind, flat in grouped.items():
+                    if kind not in sinks:
+                        directory = out / f"kind={kind}"
+                        directory.mkdir(exist_ok=True)
+                        sinks[kind] = sink_cls(directory, f"part-{flat[0]['id']:012d}")
+                    sinks[kind].write(flat)
+                    schema = state["schemas"].setdefault(kind, {})
+                    for row in flat:
+                        for key, value in row.items():
+                            if value is not None or key not in schema:
+                                schema[key] = _json_type(value)
+                    rows_by_kind[kind] = rows_by_kind.get(kind, 0) + len(flat)
+                last_id = rows[-1][0]
+    finally:
+        for sink in sinks.values():
+            sink.close()
+    # Only advance the high-water mark once every file is complete.
+    state.update(last_id=last_id, format=fmt)
+    _save_state(out, state)
+    return {
+        "format": fmt,
+        "from_id": start,
+        "last_id": last_id,
+        "rows": sum(rows_by_kind.values()),
+        "kinds": rows_by_kind,
+        "files": [str(p) for sink in sinks.values() for p in sink.files],
+    }
+
+
+def main(argv: Optional[List[Any]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Export KB entries to columnar files")
+    ap.add_argument("--out", type=Path, default=Path("exports"))
+    ap.add_argument("--kinds", nargs="*", default=None, help="only export these kinds")
+    ap.add_argument("--batch", type=int, default=5000)
+    ap.add_argument("--format", choices=FORMATS, default=None, help="default: parquet if pyarrow is installed")
+    ap.add_argument("--full", action="store_true", help="ignore the saved high-water mark")
+    args = ap.parse_args(argv)
+    print(json.dumps(export(args.out, kinds=args.kinds, batch=args.batch, fmt=args.format, full=args.full)))
+
+
+if __name__ == "__main__":
+    main()
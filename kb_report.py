@@ -1,10 +1,23 @@
-from datetime import datetime
+"""Weekly markdown report built from the knowledge base.
+
+Each section lists the week's entries whose ``role``, ``topic`` or
+``sender`` is one of the section's roles (upper-case keys), or whose
+``kind`` is one of its lower-case keys. An entry is listed once, under the
+first section it matches. One query per week fills the ``report_rows`` and
+``report_weeks`` tables. Later runs only scan entries newer than the
+recorded high-water mark, and a finished week is never scanned again.
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
 from pathlib import Path
-from kb import search
+from typing import Any, Dict, List, Optional, Tuple
+
+import kb
 from integrations.drive_client import upload_file
 from kb import add_entry
-import os
-import yaml
 
 SECTIONS = {
     "Finance": "CFO",
@@ -15,24 +28,97 @@ SECTIONS = {
 }
 
 
-def build_report():
-    week = datetime.utcnow().strftime("%Y-%W")
-    content = [f"# Weekly Report {week}\n"]
+def week_window(week: str) -> Tuple[str, str]:
+    """``YYYY-WW`` (Monday-based, as ``%Y-%W``) to a ``[start, end)`` ts range."""
+    start = datetime.strptime(f"{week}-1", "%Y-%W-%w")
+    return kb._ts(start), kb._ts(start + timedelta(days=7))
+
+
+def _section_case() -> Tuple[str, List[str]]:
+    whens, params = [], []
     for title, keys in SECTIONS.items():
-        content.append(f"## {title}\n")
-        for key in keys.split():
-            results = search(key)
-            for r in results:
-                content.append(f"- {r['data']}")
-        content.append("")
+        roles = [k for k in keys.split() if k.isupper()]
+        kinds = [k for k in keys.split() if not k.isupper()]
+        conds = []
+        if roles:
+            marks = ",".join("?" * len(roles))
+            conds.append(f"e.role IN ({marks}) OR e.topic IN ({marks}) OR e.sender IN ({marks})")
+            params += roles * 3
+        if kinds:
+            conds.append(f"e.kind IN ({','.join('?' * len(kinds))})")
+            params += kinds
+        whens.append(f"WHEN {' OR '.join(conds)} THEN ?")
+        params.append(title)
+    return f"CASE {' '.join(whens)} END", params
+
+
+def materialize(week: str) -> Dict[str, int]:
+    """Bring ``report_rows`` for ``week`` up to date; return per-section counts."""
+    start, end = week_window(week)
+    conn = kb._connect()
+    cached = conn.execute("SELECT max_id, complete, counts FROM report_weeks WHERE week = ?", (week,)).fetchone()
+    if cached and cached[1]:
+        return json.loads(cached[2])
+    since_id = cached[0] if cached else 0
+    case, case_params = _section_case()
+    sql = (
+        f"SELECT section, id, data FROM (SELECT e.id, e.data, {case} AS section FROM entries e "
+        "WHERE e.ts >= ? AND e.ts < ? AND e.id > ?) WHERE section IS NOT NULL"
+    )
+    params = (*case_params, start, end, since_id)
+    # The scan reads a pinned snapshot, so live inserts neither wait on it
+    # nor slip in between the scan and the high-water mark. Only the short
+    # write below holds the KB write lock.
+    with kb.snapshot_reader() as snap:
+        sources = [snap] + ([kb._segment(p) for p in kb._partitions(start, end)] if not cached else [])
+        high = snap.execute("SELECT coalesce(max(id), 0) FROM entries").fetchone()[0]
+        rows = [
+            (week, section, entry_id, f"- {data}")
+            for source in sources
+            for section, entry_id, data in source.execute(sql, params)
+        ]
+    with kb._lock, conn:
+        conn.executemany("INSERT OR IGNORE INTO report_rows(week, section, entry_id, line) VALUES (?, ?, ?, ?)", rows)
+        counts = dict.fromkeys(SECTIONS, 0)
+        counts.update(
+            conn.execute("SELECT section, count(*) FROM report_rows WHERE week = ? GROUP BY section", (week,)).fetchall()
+        )
+        # A week that has ended gets no new rows (ts is insertion time).
+        complete = kb._ts(datetime.utcnow()) >= end
+        conn.execute(
+            "INSERT OR REPLACE INTO report_weeks(week, max_id, complete, counts) VALUES (?, ?, ?, ?)",
+            (week, high, int(complete), json.dumps(counts)),
+        )
+    return counts
+
+
+def build_report(week: Optional[str] = None) -> Path:
+    week = week or datetime.utcnow().strftime("%Y-%W")
+    counts = materialize(week)
     path = Path("reports") / f"{week}.md"
     path.parent.mkdir(exist_ok=True)
-    path.write_text("\n".join(content), encoding="utf-8")
+    conn = kb._connect()
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(f"# Weekly Report {week}\n\n")
+        for title in SECTIONS:
+            out.write(f"## {title} ({counts.get(title, 0)})\n\n")
+            for (line,) in conn.execute(
+                "SELECT line FROM report_rows WHERE week = ? AND section = ? ORDER BY entry_id", (week, title)
+            ):
+                out.write(line + "\n")
+            out.write("\n")
     if os.environ.get("GDRIVE_PARENT_FOLDER_ID"):
         file_id = upload_file(str(path), os.environ["GDRIVE_PARENT_FOLDER_ID"], path.name)
         add_entry(kind="report", file_id=file_id, path=str(path))
     return path
 
 
+def main(argv: Optional[List[Any]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Build the weekly KB report")
+    ap.add_argument("--week", default=None, help="YYYY-WW (default: current week)")
+    args = ap.parse_args(argv)
+    print(build_report(args.week))
+
+
 if __name__ == "__main__":
-    build_report()
+    main()
@@ -0,0 +1,382 @@
+"""Local vector index for semantic retrieval over ``kb_chunk`` entries.
+
+:meth:`VectorIndex.sync` embeds new chunks into the ``chunk_embeddings``
+table. With NumPy installed, :meth:`VectorIndex.build` also writes the
+vectors to ``.npy`` files next to the database (``data/kb.db.vec/``), and
+queries memory-map those files. Small stores are searched brute force.
+From ``ivf_threshold`` vectors up, the index is an IVF (inverted file):
+vectors are clustered with spherical k-means, and a query only scans the
+``nprobe`` closest clusters. Chunks embedded after a build go to a small
+delta file that is scanned brute force; the index is rebuilt only once the
+delta outgrows ``rebuild_fraction`` of it (or ``min_delta`` vectors), or
+after embeddings are deleted. Without NumPy, search scans the table in pure
+Python.
+
+Embedders are pluggable: :class:`HashingEmbedder` is deterministic and
+offline (tests, air-gapped hosts), :class:`OllamaEmbedder` calls a local
+Ollama server. ``KB_EMBEDDER`` selects the default (``hash`` or
+``ollama``).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+import kb
+
+try:
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore[assignment]
+
+
+def _normalize(vec: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec))
+    return [x / norm for x in vec] if norm else vec
+
+
+class BaseEmbedder(ABC):
+    """Turn texts into unit-length vectors."""
+
+    name: str
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Return one L2-normalized vector per text."""
+
+
+class HashingEmbedder(BaseEmbedder):
+    """Signed feature hashing of character n-grams; no model required."""
+
+    def __init__(self, dim: int = 256, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+        self.name = f"hash{ngram}-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        out = []
+        for text in texts:
+            vec = [0.0] * self.dim
+            for word in re.findall(r"\w+", text.lower()):
+                padded = f" {word} "
+                for i in range(max(1, len(padded) - self.ngram + 1)):
+                    gram = padded[i:i + self.ngram].encode("utf-8")
+                    h = int.from_bytes(hashlib.blake2b(gram, digest_size=8).digest(), "little")
+                    vec[h % self.dim] += -1.0 if h >> 63 else 1.0
+            out.append(_normalize(vec))
+        return out
+
+
+class OllamaEmbedder(BaseEmbedder):
+    def __init__(self, endpoint: str, model: str):
+        self.endpoint = endpoint
+        self.model = model
+        self.name = f"ollama-{model}"
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        out = []
+        for text in texts:
+            r = requests.post(self.endpoint, json={"model": self.model, "prompt": text}, timeout=120)
+            r.raise_for_status()
+            out.append(_normalize([float(x) for x in r.json().get("embedding", [])]))
+        return out
+
+
+def make_embedder(kind: str, endpoint: str | None = None, model: str | None = None) -> BaseEmbedder:
+    if kind == "hash":
+        return HashingEmbedder()
+    if kind == "ollama":
+        base = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434").rstrip("/")
+        return OllamaEmbedder(endpoint or f"{base}/api/embeddings", model or "nomic-embed-text")
+    raise ValueError(f"unknown embedder {kind}")
+
+
+def _kmeans(sample: Any, nlist: int, iters: int = 10, seed: int = 0) -> Any:
+    """Spherical k-means; returns ``nlist`` unit-length centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for c in range(nlist):
+            members = sample[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1, norms)
+    return centroids
+
+
+class VectorIndex:
+    """Embeddings of ``kb_chunk`` rows plus a memory-mapped search index."""
+
+    def __init__(
+        self,
+        embedder: BaseEmbedder,
+        *,
+        ivf_threshold: int = 20000,
+        nprobe: int = 8,
+        batch: int = 256,
+        rebuild_fraction: float = 0.1,
+        min_delta: int = 1024,
+    ):
+        self.embedder = embedder
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.batch = batch
+        self.rebuild_fraction = rebuild_fraction
+        self.min_delta = min_delta
+        self._loaded: Dict[str, Any] = {}
+
+    @property
+    def directory(self) -> Path:
+        db = Path(kb.DB_PATH)
+        return db.with_name(db.name + ".vec") / re.sub(r"[^\w.-]", "_", self.embedder.name)
+
+    def sync(self) -> int:
+        """Embed chunks that have no vector for this embedder yet."""
+        conn = kb._connect()
+        added = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT e.id, coalesce(c.text, json_extract(e.data, '$.text')) "
+                "FROM entries e LEFT JOIN chunks c ON c.hash = e.sha256 "
+                "WHERE e.kind = 'kb_chunk' AND e.id > ? AND NOT EXISTS "
+                "(SELECT 1 FROM chunk_embeddings v WHERE v.entry_id = e.id AND v.embedder = ?) "
+                "ORDER BY e.id LIMIT ?",
+                (last_id, self.embedder.name, self.batch),
+            ).fetchall()
+            if not rows:
+                return added
+            vectors = self.embedder.embed([text or "" for _, text in rows])
+            with kb._lock:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO chunk_embeddings(embedder, entry_id, embedding) VALUES (?,?,?)",
+                        [
+                            (self.embedder.name, entry_id, array("f", vec).tobytes())
+                            for (entry_id, _), vec in zip(rows, vectors)
+                        ],
+                    )
+            added += len(rows)
+            last_id = rows[-1][0]
+
+    def _state(self) -> Tuple[int, int]:
+        count, max_id = kb._connect().execute(
+            "SELECT count(*), coalesce(max(entry_id), 0) FROM chunk_embeddings WHERE embedder = ?",
+            (self.embedder.name,),
+        ).fetchone()
+        return count, max_id
+
+    def _meta(self) -> Optional[Dict[str, Any]]:
+        path = self.directory / "meta.json"
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _rows(self, after: int = 0):
+        return kb._connect().execute(
+            "SELECT entry_id, embedding FROM chunk_embeddings WHERE embedder = ? AND entry_id > ? ORDER BY entry_id",
+            (self.embedder.name, after),
+        )
+
+    def _arrays(self, after: int = 0) -> Tuple[Any, Any]:
+        ids_list: List[int] = []
+        blobs: List[bytes] = []
+        for entry_id, blob in self._rows(after):
+            ids_list.append(entry_id)
+            blobs.append(blob)
+        ids = np.array(ids_list, dtype=np.int64)
+        vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(ids), -1) if blobs else (
+            np.zeros((0, 0), dtype=np.float32)
+        )
+        return ids, vectors
+
+    def _write_meta(self, meta: Dict[str, Any]) -> None:
+        directory = self.directory
+        tmp = directory / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, directory / "meta.json")
+        # Old files may still be mapped by another reader; best effort.
+        gen, rev = meta["generation"], meta["delta_rev"]
+        keep = {f"{name}-{gen}" for name in ("vectors", "ids", "centroids", "offsets")}
+        keep |= {f"delta-{name}-{gen}-{rev}" for name in ("vectors", "ids")}
+        for path in directory.glob("*.npy"):
+            if path.stem not in keep:
+                try:
+                    path.unlink()
+                except OSError:  # pragma: no cover - mapped on Windows
+                    pass
+
+    def build(self) -> Dict[str, Any]:
+        """Write the memory-mapped index files for the current embeddings."""
+        if np is None:
+            raise RuntimeError("numpy is required to build the vector index")
+        ids, vectors = self._arrays()
+        old = self._meta() or {}
+        gen = old.get("generation", 0) + 1
+        meta: Dict[str, Any] = {
+            "embedder": self.embedder.name,
+            "generation": gen,
+            "count": len(ids),
+            "max_id": int(ids[-1]) if len(ids) else 0,
+            "ivf": False,
+            "delta": 0,
+            "delta_rev": 0,
+        }
+        directory = self.directory
+        directory.mkdir(parents=True, exist_ok=True)
+        if len(ids) >= self.ivf_threshold:
+            trained = old.get("trained_count", 0)
+            centroids = self._loaded.get("centroids") if old.get("ivf") else None
+            if centroids is None and old.get("ivf"):
+                centroids = np.load(directory / f"centroids-{old['generation']}.npy")
+            if centroids is None or len(ids) > 2 * trained:
+                # Retrain only when the store has doubled since the last fit.
+                nlist = max(1, int(math.sqrt(len(ids))))
+                rng = np.random.default_rng(0)
+                sample = vectors[rng.choice(len(ids), size=min(len(ids), nlist * 64), replace=False)]
+                centroids = _kmeans(sample, nlist)
+                trained = len(ids)
+            assign = np.concatenate(
+                [np.argmax(vectors[i:i + 8192] @ centroids.T, axis=1) for i in range(0, len(ids), 8192)]
+            )
+            order = np.argsort(assign, kind="stable")
+            vectors, ids = vectors[order], ids[order]
+            offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+            np.save(directory / f"centroids-{gen}.npy", centroids)
+            np.save(directory / f"offsets-{gen}.npy", offsets)
+            meta.update(ivf=True, nlist=len(centroids), trained_count=trained)
+        np.save(directory / f"vectors-{gen}.npy", np.ascontiguousarray(vectors))
+        np.save(directory / f"ids-{gen}.npy", ids)
+        self._write_meta(meta)
+        self._loaded = {}
+        return meta
+
+    def append(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """Add embeddings newer than ``meta["max_id"]`` to the delta files."""
+        gen, rev = meta["generation"], meta["delta_rev"] + 1
+        ids, vectors = self._arrays(meta["max_id"])
+        if meta["delta"]:
+            idx = self._load(meta)
+            ids = np.concatenate([idx["delta_ids"], ids])
+            vectors = np.concatenate([idx["delta_vectors"], vectors])
+        np.save(self.directory / f"delta-vectors-{gen}-{rev}.npy", np.ascontiguousarray(vectors))
+        np.save(self.directory / f"delta-ids-{gen}-{rev}.npy", ids)
+        added = len(ids) - meta["delta"]
+        meta = dict(meta, count=meta["count"] + added, max_id=int(ids[-1]), delta=len(ids), delta_rev=rev)
+        self._write_meta(meta)
+        return meta
+
+    def refresh(self) -> None:
+        """Embed new chunks and bring the index files up to date.
+
+        New embeddings are appended to the delta; the index is rebuilt when
+        there is no index yet, embeddings were deleted, or the delta has
+        grown past its threshold.
+        """
+        self.sync()
+        if np is None:
+            return
+        meta = self._meta()
+        count, max_id = self._state()
+        if meta is not None and (meta["count"], meta["max_id"]) == (count, max_id):
+            return
+        if meta is None or "delta" not in meta or count < meta["count"]:
+            self.build()
+            return
+        (new,) = kb._connect().execute(
+            "SELECT count(*) FROM chunk_embeddings WHERE embedder = ? AND entry_id > ?",
+            (self.embedder.name, meta["max_id"]),
+        ).fetchone()
+        delta = meta["delta"] + new
+        base = meta["count"] - meta["delta"]
+        if meta["count"] + new != count or delta > max(self.min_delta, self.rebuild_fraction * base):
+            self.build()
+        else:
+            self.append(meta)
+
+    def _load(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        gen, rev = meta["generation"], meta.get("delta_rev", 0)
+        directory = self.directory
+        if self._loaded.get("generation") != gen:
+            loaded: Dict[str, Any] = {"generation": gen}
+            loaded["vectors"] = np.load(directory / f"vectors-{gen}.npy", mmap_mode="r")
+            loaded["ids"] = np.load(directory / f"ids-{gen}.npy", mmap_mode="r")
+            if meta["ivf"]:
+                loaded["centroids"] = np.load(directory / f"centroids-{gen}.npy")
+                loaded["offsets"] = np.load(directory / f"offsets-{gen}.npy")
+            self._loaded = loaded
+        if self._loaded.get("delta_rev") != rev:
+            self._loaded["delta_rev"] = rev
+            if meta.get("delta"):
+                self._loaded["delta_vectors"] = np.load(directory / f"delta-vectors-{gen}-{rev}.npy")
+                self._loaded["delta_ids"] = np.load(directory / f"delta-ids-{gen}-{rev}.npy")
+            else:
+                self._loaded.pop("delta_vectors", None)
+                self._loaded.pop("delta_ids", None)
+        return self._loaded
+
+    def search(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Return ``(entry_id, cosine_similarity)`` pairs, best first."""
+        self.refresh()
+        query = self.embedder.embed([text])[0]
+        if np is None:
+            return self._scan(query, k)
+        meta = self._meta()
+        if not meta or not meta["count"]:
+            return []
+        idx = self._load(meta)
+        q = np.asarray(query, dtype=np.float32)
+        if meta["ivf"]:
+            probe = np.argsort(-(idx["centroids"] @ q))[: self.nprobe]
+            offsets = idx["offsets"]
+            spans = [(offsets[c], offsets[c + 1]) for c in probe if offsets[c + 1] > offsets[c]]
+            parts = [(idx["vectors"][a:b], idx["ids"][a:b]) for a, b in spans]
+        else:
+            parts = [(idx["vectors"], idx["ids"])]
+        if "delta_ids" in idx:
+            parts.append((idx["delta_vectors"], idx["delta_ids"]))
+        parts = [(v, i) for v, i in parts if len(i)]
+        if not parts:
+            return []
+        scores = np.concatenate([v @ q for v, _ in parts])
+        ids = np.concatenate([i for _, i in parts])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _scan(self, query: List[float], k: int) -> List[Tuple[int, float]]:
+        scored = (
+            (sum(a * b for a, b in zip(query, array("f", blob))), entry_id)
+            for entry_id, blob in self._rows()
+        )
+        return [(entry_id, score) for score, entry_id in heapq.nlargest(k, scored)]
+
+
+_default: Optional[VectorIndex] = None
+
+
+def default_index() -> VectorIndex:
+    global _default
+    if _default is None:
+        _default = VectorIndex(make_embedder(os.environ.get("KB_EMBEDDER", "hash")))
+    return _default
+
+
+def search(text: str, k: int = 5, index: Optional[VectorIndex] = None) -> List[dict]:
+    """Semantic search over ``kb_chunk`` entries; rows gain a ``score``."""
+    index = index or default_index()
+    return [dict(kb.get(entry_id), score=score) for entry_id, score in index.search(text, k)]
@@ -6,7 +6,10 @@ import typer
 import requests
 import atexit
 from pathlib import Path
+from urllib.parse import quote
 from admin_policy import evaluate_ceo_decision
+import bus_client
+from bus_transport import transport_for
 
 app = typer.Typer()
 profile_app = typer.Typer()
@@ -33,10 +36,40 @@ atexit.register(_shutdown)
 
 
 def spawn_bus():
-    p = subprocess.Popen(["python", "bus_server.py"])
-    processes.append(p)
-    os.environ["BUS_URL"] = "http://127.0.0.1:7088"
-    _wait_health("http://127.0.0.1:7088/health")
+    """Start the bus; ``BUS_WORKERS=N`` starts N shards on consecutive ports.
+
+    With ``BUS_UDS=<path>`` the bus listens on a Unix domain socket instead
+    (``<path>.<i>`` per shard) and ``BUS_URL`` uses ``http+unix://``.
+    """
+    workers = int(os.environ.get("BUS_WORKERS", 1))
+    uds = os.environ.get("BUS_UDS", "")
+    if workers <= 1:
+        p = subprocess.Popen(["python", "bus_server.py"])
+        processes.append(p)
+        url = f"http+unix://{quote(uds, safe='')}" if uds else "http://127.0.0.1:7088"
+        _wait_health(f"{url}/health")
+        os.environ["BUS_URL"] = url
+        return
+    if uds:
+        urls = [f"http+unix://{quote(f'{uds}.{i}', safe='')}" for i in range(workers)]
+    else:
+        urls = [f"http://127.0.0.1:{7088 + i}" for i in range(workers)]
+    log_dir = os.environ.get("BUS_LOG_DIR", "data/bus_log")
+    for i, url in enumerate(urls):
+        env = os.environ.copy()
+        env.update(
+            {
+                "BUS_PORT": str(7088 + i),
+                "BUS_UDS": uds and f"{uds}.{i}",
+                "BUS_SHARD": url,
+                "BUS_SHARDS": ",".join(urls),
+                "BUS_LOG_DIR": log_dir and f"{log_dir}/shard-{i}",
+            }
+        )
+        processes.append(subprocess.Popen(["python", "bus_server.py"], env=env))
+    for url in urls:
+        _wait_health(f"{url}/health")
+    os.environ["BUS_URL"] = ",".join(urls)
 
 
 def spawn_stripe():
@@ -68,7 +101,7 @@ def spawn_agent(role: str, info: dict):
 def _wait_health(url: str, retries: int = 20):
     for _ in range(retries):
         try:
-            r = requests.get(url, timeout=3)
+            r = transport_for(url).request("get", url, timeout=3)
             if r.status_code == 200:
                 return
         except Exception:
@@ -79,14 +112,17 @@ def _wait_health(url: str, retries: int = 20):
 
 def route(sender: str, target: str, text: str):
     bus = os.environ.get("BUS_URL", "http://127.0.0.1:7088")
-    requests.post(f"{bus}/publish", json={"topic": target, "data": {"sender": sender, "text": text}})
+    r = bus_client.publish(bus, target, {"sender": sender, "text": text})
+    if r.status_code == 429:
+        return "full"
+    return r.json().get("status", "ok") if r.ok else f"error {r.status_code}"
 
 
 def check_ceo(decision_summary: str):
     verdict = evaluate_ceo_decision(decision_summary)
     if verdict == "harmful":
-        route("admin", "CHRO", decision_summary)
-        route("admin", "COO", decision_summary)
+        bus = os.environ.get("BUS_URL", "http://127.0.0.1:7088")
+        bus_client.publish_batch(bus, topics=["CHRO", "COO"], data={"sender": "admin", "text": decision_summary})
     return verdict
 
 
@@ -1,13 +1,28 @@
+import asyncio
 import os
 import stripe
+from typing import List
 from fastapi import FastAPI, Request, HTTPException
-from kb import add_entry
-import requests
+from bus_client import publish_batch
+from kb import aadd_entry
 
 app = FastAPI()
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY", "")
 WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
 BUS_URL = os.environ.get("BUS_URL", "http://127.0.0.1:7088")
+ROLES = ["CFO", "COO", "CEO", "CMO", "CPO"]
+# Payment events jump ahead of routine chatter on the bus (lanes 0-9).
+PRIORITY = int(os.environ.get("STRIPE_BUS_PRIORITY", 7))
+
+
+def _fan_out(event_type: str) -> List[str]:
+    """Publish to every role in one request; return the roles left undelivered."""
+    # Blocking, and may wait out a full topic's Retry-After; runs in a thread.
+    r = publish_batch(BUS_URL, topics=ROLES, data={"stripe_event": event_type}, priority=PRIORITY)
+    if r.status_code != 200:
+        # 429, auth, shard or proxy errors carry no per-topic results.
+        return list(ROLES)
+    return [res["topic"] for res in r.json()["results"] if res["status"] != "ok"]
 
 
 @app.get("/health")
@@ -23,9 +38,10 @@ async def webhook(request: Request):
         event = stripe.Webhook.construct_event(payload, sig, WEBHOOK_SECRET)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    add_entry(kind="stripe_event", type=event.get("type"))
-    for role in ["CFO", "COO", "CEO", "CMO", "CPO"]:
-        requests.post(f"{BUS_URL}/publish", json={"topic": role, "data": {"stripe_event": event.get("type")}})
+    await aadd_entry(kind="stripe_event", type=event.get("type"))
+    missed = await asyncio.to_thread(_fan_out, event.get("type"))
+    if missed:
+        await aadd_entry(kind="bus_backpressure", source="stripe", type=event.get("type"), topics=missed)
     return {"status": "ok"}
 
 
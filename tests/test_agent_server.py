@@ -65,10 +65,10 @@ def test_agent_chat_endpoints(monkeypatch):
     monkeypatch.setattr(agent_server, "subscriber", dummy_sub)
     recorded = []
 
-    def fake_add_entry(**kw):
+    async def fake_aadd_entry(**kw):
         recorded.append(kw)
 
-    monkeypatch.setattr(agent_server, "add_entry", fake_add_entry)
+    monkeypatch.setattr(agent_server, "aadd_entry", fake_aadd_entry)
 
     client = TestClient(agent_server.app)
     r = client.post("/chat", json={"sender": "user", "message": "hi"})
@@ -0,0 +1,28 @@
+import time
+
+from bus_audit import AuditSink, parse_policies
+
+
+def test_policies_and_background_batches():
+    """Full topics are written in batches off-thread; drop/sample topics are filtered."""
+    batches = []
+    sink = AuditSink(
+        batches.append,
+        policies=parse_policies("noise=drop, metrics=sample:0"),
+        interval_ms=10,
+        max_batch=50,
+    )
+    for i in range(120):
+        sink.record("CFO", {"n": i})
+        sink.record("noise", {"n": i})
+        sink.record("metrics", {"n": i})
+    deadline = time.monotonic() + 2
+    while sum(map(len, batches)) < 120 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sink.close()
+    rows = [row for batch in batches for row in batch]
+    assert [row["payload"]["n"] for row in rows] == list(range(120))
+    assert {row["topic"] for row in rows} == {"CFO"} and max(map(len, batches)) <= 50
+    stats = sink.stats()
+    assert stats["written"] == 120 and stats["dropped"] == 120 and stats["sampled_out"] == 120
+    assert stats["pending"] == 0
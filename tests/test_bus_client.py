@@ -0,0 +1,194 @@
+import asyncio
+import time
+
+import pytest
+
+import bus_client
+from bus_client import BusClient
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+def test_run_consumes_batches(monkeypatch):
+    """One long-poll delivers a whole batch to the handler."""
+    calls = []
+    batches = [[{"n": 0}, {"n": 1}, {"n": 2}], []]
+    received = []
+    client = BusClient("http://bus", "CFO", received.append, token="secret", batch=50, wait=5, lease=None)
+
+    def fake_request(method, url, **kwargs):
+        calls.append((url, kwargs["params"], kwargs["timeout"]))
+        body = batches.pop(0)
+        if not batches:
+            client.stop()
+        return FakeResponse(body)
+
+    monkeypatch.setattr(bus_client.requests, "request", fake_request)
+    client.run()
+    assert received == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert calls[0] == ("http://bus/get", {"topic": "CFO", "max": 50, "wait": 5}, 15)
+    assert len(calls) == 2
+
+
+class FakeStream(FakeResponse):
+    def __init__(self, lines):
+        super().__init__(None)
+        self.lines = lines
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+
+def test_stream_mode_reads_server_sent_events(monkeypatch):
+    """Streaming mode holds one SSE connection and skips keepalives."""
+    received = []
+
+    def handler(msg):
+        received.append(msg)
+        if len(received) == 2:
+            client.stop()
+
+    client = BusClient("http://bus", "CTO", handler, token="secret", stream=True)
+    lines = [": keepalive", "", "event: message", 'data: {"n": 1}', "", "event: message", 'data: {"n": 2}', ""]
+
+    def fake_request(method, url, **kwargs):
+        assert url == "http://bus/subscribe/sse" and kwargs["stream"] is True
+        return FakeStream(lines)
+
+    monkeypatch.setattr(bus_client.requests, "request", fake_request)
+    client.run()
+    assert received == [{"n": 1}, {"n": 2}]
+
+
+def test_leased_batches_are_acked_once(monkeypatch):
+    """Handled messages are acked and failures nacked in one call per batch."""
+    posts = []
+
+    def handler(msg):
+        if msg["n"] == 1:
+            raise ValueError("boom")
+
+    client = BusClient("http://bus", "CFO", handler, token="secret", lease=30)
+    envelopes = [{"id": f"{i}-1", "data": {"n": i}, "attempts": 1} for i in range(3)]
+
+    def fake_request(method, url, **kwargs):
+        if method == "post":
+            posts.append((url, kwargs["json"]))
+            client.stop()
+            return FakeResponse({})
+        assert kwargs["params"]["lease"] == 30
+        return FakeResponse(envelopes)
+
+    monkeypatch.setattr(bus_client.requests, "request", fake_request)
+    monkeypatch.setattr(bus_client, "add_entry", lambda **kw: None)
+    client.run()
+    assert posts == [("http://bus/ack", {"topic": "CFO", "ids": ["0-1", "2-1"], "nack": ["1-1"]})]
+
+
+def test_publish_waits_out_backpressure(monkeypatch):
+    """429 responses are retried after Retry-After until the budget runs out."""
+    sleeps = []
+    responses = [FakeResponse({}), FakeResponse({"status": "ok"})]
+    responses[0].status_code = 429
+    responses[0].headers = {"Retry-After": "2"}
+
+    def fake_post(url, **kwargs):
+        assert kwargs["headers"] == {"Authorization": "Bearer secret"}
+        return responses.pop(0)
+
+    monkeypatch.setattr(bus_client.requests, "post", fake_post)
+    monkeypatch.setattr(bus_client.time, "sleep", sleeps.append)
+    r = bus_client.publish("http://bus/", "CFO", {"text": "hi"}, token="secret")
+    assert r.json() == {"status": "ok"} and sleeps == [2.0]
+
+    full = FakeResponse({})
+    full.status_code = 429
+    full.headers = {"Retry-After": "5"}
+    monkeypatch.setattr(bus_client.requests, "post", lambda url, **kw: full)
+    assert bus_client.publish("http://bus", "CFO", {}, token="secret", max_wait=1).status_code == 429
+
+
+def test_sharded_publish_batch_splits_by_owner(monkeypatch):
+    """One request per shard; results come back in input order."""
+    shards = "http://a,http://b"
+    topics = [f"role-{i}" for i in range(10)]
+    sent = {}
+
+    def fake_post(url, json, **kwargs):
+        sent[url] = [m["topic"] for m in json["messages"]]
+        if url.startswith("http://b"):
+            r = FakeResponse({})
+            r.status_code = 429
+            r.headers = {"Retry-After": "5"}
+            return r
+        return FakeResponse({"status": "ok", "results": [{"topic": t, "status": "ok", "offset": None} for t in sent[url]]})
+
+    monkeypatch.setattr(bus_client.requests, "post", fake_post)
+    r = bus_client.publish_batch(shards, topics=topics, data={"x": 1}, token="secret", max_wait=0)
+    owners = {t: bus_client.url_for(shards, t) for t in topics}
+    assert set(owners.values()) == {"http://a", "http://b"}
+    assert sorted(sum(sent.values(), [])) == sorted(topics)
+    assert r.status_code == 200
+    expected = ["ok" if owners[t] == "http://a" else "full" for t in topics]
+    assert [res["status"] for res in r.json()["results"]] == expected
+
+
+def test_priority_and_ttl_are_sent_only_when_set(monkeypatch):
+    bodies = []
+    monkeypatch.setattr(bus_client.requests, "post", lambda url, json, **kw: bodies.append(json) or FakeResponse({}))
+    bus_client.publish("http://bus", "CFO", {"x": 1}, token="secret")
+    bus_client.publish("http://bus", "CFO", {"x": 1}, priority=7, ttl=30, token="secret")
+    bus_client.publish_batch("http://bus", topics=["CFO", "COO"], data={"x": 1}, priority=5, token="secret")
+    assert bodies == [
+        {"topic": "CFO", "data": {"x": 1}},
+        {"topic": "CFO", "data": {"x": 1}, "priority": 7, "ttl": 30},
+        {"topics": ["CFO", "COO"], "data": {"x": 1}, "priority": 5},
+    ]
+
+
+def test_publish_batch_needs_messages_or_topics_and_data():
+    with pytest.raises(ValueError):
+        bus_client.publish_batch("http://bus", topics=["CFO"])
+    with pytest.raises(ValueError):
+        bus_client.publish_batch("http://bus", data={"x": 1})
+
+
+def test_async_publish_keeps_the_event_loop_running(monkeypatch):
+    """Backpressure waits inside BusClient.publish do not freeze the caller's loop."""
+
+    def slow_request(method, url, **kwargs):
+        time.sleep(0.3)  # stands in for Retry-After sleeps
+        return FakeResponse({"status": "ok"})
+
+    monkeypatch.setattr(bus_client.requests, "request", slow_request)
+    client = BusClient("http://bus", "CEO", lambda msg: None, token="secret")
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await client.publish("CFO", "hello")
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) > 10
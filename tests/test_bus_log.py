@@ -0,0 +1,65 @@
+from bus_log import BusLog
+
+
+def test_append_scan_and_roll(tmp_path):
+    """Offsets are dense across segments and replay starts anywhere."""
+    log = BusLog(tmp_path, segment_bytes=64, index_every=2)
+    offsets = [log.append("CFO/alerts", {"n": i}) for i in range(10)]
+    assert offsets == list(range(10))
+    assert log.stats()["CFO/alerts"]["segments"] > 1
+    assert log.read("CFO/alerts", 7) == [(7, {"n": 7}), (8, {"n": 8}), (9, {"n": 9})]
+    assert [o for o, _ in log.scan("CFO/alerts", 3)] == list(range(3, 10))
+    assert log.read("missing", 0) == []
+    log.close()
+
+
+def test_recovery_truncates_torn_tail_and_keeps_offsets(tmp_path):
+    log = BusLog(tmp_path)
+    for i in range(5):
+        log.append("ops", {"n": i})
+    log.commit("ops", "bus", 3)
+    log.close()
+    (segment,) = (tmp_path / "ops").glob("*.log")
+    with open(segment, "ab") as fh:
+        fh.write(b"\x40\x00\x00\x00garbage")
+
+    log = BusLog(tmp_path)
+    assert log.end_offset("ops") == 5
+    assert log.committed("ops", "bus") == 3 and log.committed("ops", "audit") == 0
+    assert [d["n"] for _, d in log.scan("ops", 3)] == [3, 4]
+    assert log.append("ops", {"n": 5}) == 5
+    assert log.read("ops", 5) == [(5, {"n": 5})]
+    log.close()
+
+
+def test_metadata_round_trips_next_to_plain_records(tmp_path):
+    log = BusLog(tmp_path)
+    log.append("CFO", {"n": 0})
+    log.append("CFO", {"n": 1}, {"priority": 7, "expires": 123.5})
+    log.close()
+    log = BusLog(tmp_path)
+    assert list(log.scan("CFO", meta=True)) == [(0, {"n": 0}, {}), (1, {"n": 1}, {"priority": 7, "expires": 123.5})]
+    assert log.read("CFO", 0) == [(0, {"n": 0}), (1, {"n": 1})]
+    log.close()
+
+
+def test_segments_below_every_group_are_deleted(tmp_path):
+    """Retention keeps what the slowest group may still read, and restarts skip the rest."""
+    log = BusLog(tmp_path, segment_bytes=64)
+    for i in range(12):
+        log.append("ops", {"n": i})
+    segments = log.stats()["ops"]["segments"]
+    log.commit("ops", "bus", 11)
+    log.commit("ops", "replay", 6)
+    log.sync()
+    start = log.start_offset("ops")
+    assert 0 < start <= 6 and log.stats()["ops"]["segments"] < segments
+    assert [o for o, _ in log.scan("ops", 0)] == list(range(start, 12))
+    log.commit("ops", "replay", 12)
+    log.close()
+
+    log = BusLog(tmp_path, segment_bytes=64)
+    assert log.stats()["ops"]["segments"] == 1 and len(list((tmp_path / "ops").glob("*.log"))) == 1
+    assert log.end_offset("ops") == 12 and 6 < log.start_offset("ops") <= 11
+    assert log.append("ops", {"n": 12}) == 12
+    log.close()
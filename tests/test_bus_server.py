@@ -1,19 +1,28 @@
 import json
+import time
 from pathlib import Path
 
+import pytest
 from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
 
 import bus_server
 
 
+@pytest.fixture(autouse=True)
+def audit_rows(monkeypatch):
+    """Keep audit rows out of the real KB and flush them before patches unwind."""
+    rows = []
+    monkeypatch.setattr(bus_server, "add_entries", rows.extend)
+    yield rows
+    bus_server.audit.flush()
+
+
 def test_publish_get_cycle(monkeypatch):
     """Publish and retrieve a message via the bus."""
     recorded = []
 
-    def fake_add_entry(**kw):
-        recorded.append(kw)
-
-    monkeypatch.setattr(bus_server, "add_entry", fake_add_entry)
+    monkeypatch.setattr(bus_server, "add_entries", recorded.extend)
     monkeypatch.setenv("BUS_TOKEN", "secret")
 
     client = TestClient(bus_server.app)
@@ -24,6 +33,7 @@ def test_publish_get_cycle(monkeypatch):
     r = client.get("/get", params={"topic": msg["topic"]}, headers=headers)
     assert r.status_code == 200
     assert r.json() == msg["data"]
+    bus_server.audit.flush()
     assert recorded and recorded[0]["kind"] == "bus_message"
 
 
@@ -38,3 +48,276 @@ def test_reject_invalid_token(monkeypatch):
     assert r.status_code == 401
     r = client.post("/publish", json=msg)
     assert r.status_code == 403
+
+
+def test_kb_stream_formats_events(monkeypatch):
+    """The KB change feed is served as server-sent events."""
+    calls = []
+
+    async def fake_atail(since_id, kinds=None, heartbeat=None):
+        calls.append((since_id, kinds))
+        yield {"id": 7, "kind": "chat", "data": "{}", "ts": "2026-01-01 00:00:00"}
+        yield None
+
+    monkeypatch.setattr(bus_server, "atail", fake_atail)
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret", "Last-Event-ID": "5"}
+    r = client.get("/kb/stream", params={"kinds": "chat,memo"}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.text.startswith("id: 7\nevent: chat\ndata: ")
+    assert r.text.endswith(": keepalive\n\n")
+    assert calls == [(5, ["chat", "memo"])]
+    headers["Last-Event-ID"] = "not-an-id"
+    assert client.get("/kb/stream", headers=headers).status_code == 400
+    assert len(calls) == 1
+
+
+def test_get_batches_and_times_out(monkeypatch):
+    """``max`` returns a list of queued messages; ``wait`` bounds the poll."""
+
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    for i in range(3):
+        client.post("/publish", json={"topic": "batch", "data": {"n": i}}, headers=headers)
+    r = client.get("/get", params={"topic": "batch", "max": 2, "wait": 0.1}, headers=headers)
+    assert r.json() == [{"n": 0}, {"n": 1}]
+    r = client.get("/get", params={"topic": "batch", "max": 10, "wait": 0.1}, headers=headers)
+    assert r.json() == [{"n": 2}]
+    r = client.get("/get", params={"topic": "batch", "max": 10, "wait": 0.1}, headers=headers)
+    assert r.status_code == 200 and r.json() == []
+    r = client.get("/get", params={"topic": "batch", "wait": 0.1}, headers=headers)
+    assert r.status_code == 204
+
+
+def test_websocket_subscription_respects_credits(monkeypatch):
+    """Only granted credits are pushed; the rest stays queued."""
+
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    for i in range(3):
+        client.post("/publish", json={"topic": "ws", "data": {"n": i}}, headers=headers)
+    with client.websocket_connect("/subscribe?topic=ws&credit=1", headers=headers) as ws:
+        assert ws.receive_json() == {"topic": "ws", "data": {"n": 0}}
+        ws.send_json({"credit": 1})
+        assert ws.receive_json()["data"] == {"n": 1}
+    r = client.get("/get", params={"topic": "ws", "max": 10, "wait": 0}, headers=headers)
+    assert r.json() == [{"n": 2}]
+
+
+def test_websocket_rejects_bad_token(monkeypatch):
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect("/subscribe?topic=ws&token=wrong") as ws:
+            ws.receive_json()
+
+
+def test_log_survives_restart_and_replays(tmp_path, monkeypatch):
+    """Undelivered messages are requeued from the log on startup."""
+    recorded = []
+
+    monkeypatch.setattr(bus_server, "add_entries", recorded.extend)
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    monkeypatch.setenv("BUS_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(bus_server.audit, "default", "drop")
+    headers = {"Authorization": "Bearer secret"}
+    with TestClient(bus_server.app) as client:
+        for i in range(3):
+            r = client.post("/publish", json={"topic": "durable", "data": {"n": i}}, headers=headers)
+            assert r.json()["offset"] == i
+        assert client.get("/get", params={"topic": "durable"}, headers=headers).json() == {"n": 0}
+    bus_server.queues.clear()
+    with TestClient(bus_server.app) as client:
+        r = client.get("/get", params={"topic": "durable", "max": 10, "wait": 0}, headers=headers)
+        assert r.json() == [{"n": 1}, {"n": 2}]
+        r = client.get("/log", params={"topic": "durable", "offset": 1, "max": 1}, headers=headers)
+        assert r.json() == {"messages": [{"offset": 1, "data": {"n": 1}}], "next": 2, "end": 3}
+        client.post("/offsets", json={"topic": "durable", "group": "audit", "offset": 2}, headers=headers)
+        r = client.get("/offsets", params={"topic": "durable", "group": "audit"}, headers=headers)
+        assert r.json()["offset"] == 2
+    bus_server.audit.flush()
+    assert recorded == []
+
+
+def test_leased_delivery_redelivers_and_dead_letters(monkeypatch):
+    """Unacked leases come back; repeated failures land on the .dlq topic."""
+
+    monkeypatch.setattr(bus_server, "MAX_ATTEMPTS", 2)
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    for i in range(2):
+        client.post("/publish", json={"topic": "lease", "data": {"n": i}}, headers=headers)
+    first = client.get("/get", params={"topic": "lease", "max": 10, "lease": 0.2}, headers=headers).json()
+    assert [(m["data"], m["attempts"]) for m in first] == [({"n": 0}, 1), ({"n": 1}, 1)]
+    r = client.post("/ack", json={"topic": "lease", "ids": [first[0]["id"]]}, headers=headers)
+    assert r.json() == {"acked": 1, "nacked": 0}
+    assert client.get("/get", params={"topic": "lease", "max": 10, "wait": 0}, headers=headers).json() == []
+
+    again = client.get("/get", params={"topic": "lease", "max": 10, "wait": 2, "lease": 30}, headers=headers).json()
+    assert [(m["data"], m["attempts"]) for m in again] == [({"n": 1}, 2)]
+    assert client.post("/ack", json={"topic": "lease", "ids": [first[1]["id"]]}, headers=headers).json()["acked"] == 0
+    r = client.post("/ack", json={"topic": "lease", "nack": [again[0]["id"]]}, headers=headers)
+    assert r.json() == {"acked": 0, "nacked": 1}
+    assert client.get("/get", params={"topic": "lease", "max": 10, "wait": 0}, headers=headers).json() == []
+    dead = client.get("/get", params={"topic": "lease.dlq", "max": 10, "wait": 0}, headers=headers).json()
+    assert dead == [{"topic": "lease", "attempts": 2, "data": {"n": 1}}]
+
+
+def test_queue_policies_bound_topics(monkeypatch):
+    """Full topics reject with 429, evict the oldest, or drop the newest."""
+
+    monkeypatch.setattr(bus_server, "QUEUE_MAX", 2)
+    monkeypatch.setattr(bus_server, "TOPIC_POLICIES", {"old": "drop_oldest", "new": "drop_newest"})
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    statuses = {}
+    for topic in ("blk", "old", "new"):
+        statuses[topic] = [
+            client.post("/publish", json={"topic": topic, "data": {"n": i}}, headers=headers) for i in range(3)
+        ]
+    assert [r.status_code for r in statuses["blk"]] == [200, 200, 429]
+    assert statuses["blk"][2].headers["retry-after"] == "1"
+    assert statuses["new"][2].json() == {"status": "dropped"}
+
+    def drain(topic):
+        return client.get("/get", params={"topic": topic, "max": 10, "wait": 0}, headers=headers).json()
+
+    stats = client.get("/stats", headers=headers).json()
+    assert stats["topics"]["old"]["dropped"] == 1 and stats["topics"]["blk"]["rejected"] == 1
+    assert stats["topics"]["blk"]["bytes"] == len('{"n":0}') * 2
+    assert drain("blk") == [{"n": 0}, {"n": 1}]
+    assert drain("old") == [{"n": 1}, {"n": 2}]
+    assert drain("new") == [{"n": 0}, {"n": 1}]
+    assert client.get("/stats", headers=headers).json()["topics"]["blk"]["bytes"] == 0
+
+
+def test_expired_messages_free_block_capacity(monkeypatch):
+    """Messages whose TTL ran out no longer count toward a block topic's limit."""
+    monkeypatch.setattr(bus_server, "QUEUE_MAX", 2)
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    for i in range(2):
+        r = client.post("/publish", json={"topic": "stale", "data": {"n": i}, "ttl": 0.05}, headers=headers)
+        assert r.status_code == 200
+    assert client.post("/publish", json={"topic": "stale", "data": {"n": 2}}, headers=headers).status_code == 429
+    time.sleep(0.1)
+    assert client.post("/publish", json={"topic": "stale", "data": {"n": 3}}, headers=headers).status_code == 200
+    r = client.post("/publish_batch", json={"topics": ["stale"], "data": {"n": 4}}, headers=headers)
+    assert r.json()["results"][0]["status"] == "ok"
+    assert client.get("/get", params={"topic": "stale"}, headers=headers).json() == {"n": 3}
+    assert client.get("/stats", headers=headers).json()["topics"]["stale"]["expired"] == 2
+
+
+def test_publish_batch_fans_out_atomically(monkeypatch):
+    """Pairs or fan-out publish in one call; a full block topic rejects the lot."""
+    writes = []
+    monkeypatch.setattr(bus_server, "add_entries", writes.extend)
+    monkeypatch.setattr(bus_server, "QUEUE_MAX", 2)
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    r = client.post("/publish_batch", json={"topics": ["fanA", "fanB"], "data": {"x": 1}}, headers=headers)
+    assert [res["status"] for res in r.json()["results"]] == ["ok", "ok"]
+    bus_server.audit.flush()
+    assert writes == [{"kind": "bus_message", "topic": t, "payload": {"x": 1}} for t in ("fanA", "fanB")]
+    pairs = {"messages": [{"topic": "fanA", "data": {"x": 2}}, {"topic": "fanC", "data": {"x": 3}}]}
+    assert client.post("/publish_batch", json=pairs, headers=headers).status_code == 200
+    pairs = {"messages": [{"topic": "fanC", "data": {"x": 4}}, {"topic": "fanA", "data": {"x": 5}}]}
+    assert client.post("/publish_batch", json=pairs, headers=headers).status_code == 429
+    bus_server.audit.flush()
+    assert len(writes) == 4
+    bad = client.post("/publish_batch", json={"topics": ["fanA"]}, headers=headers)
+    assert bad.status_code == 422
+    r = client.get("/get", params={"topic": "fanC", "max": 10, "wait": 0}, headers=headers)
+    assert r.json() == [{"x": 3}]
+
+
+def test_publish_batch_drops_what_drop_oldest_cannot_fit(monkeypatch, audit_rows):
+    """A drop_oldest message too big for its topic is dropped alone, with no 500."""
+    monkeypatch.setattr(bus_server, "QUEUE_MAX_BYTES", 64)
+    monkeypatch.setattr(bus_server, "TOPIC_POLICIES", {"bigA": "drop_oldest"})
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    batch = {"messages": [{"topic": "smallB", "data": {"x": 1}}, {"topic": "bigA", "data": {"x": "y" * 100}}]}
+    r = client.post("/publish_batch", json=batch, headers=headers)
+    assert r.status_code == 200
+    assert [res["status"] for res in r.json()["results"]] == ["ok", "dropped"]
+    bus_server.audit.flush()
+    assert [row["topic"] for row in audit_rows] == ["smallB"]
+    assert client.get("/get", params={"topic": "smallB", "max": 5, "wait": 0}, headers=headers).json() == [{"x": 1}]
+
+
+def test_drop_oldest_keeps_its_queue_when_the_message_cannot_fit(monkeypatch):
+    """An oversized publish is refused without evicting what is already queued."""
+    monkeypatch.setattr(bus_server, "QUEUE_MAX_BYTES", 64)
+    monkeypatch.setattr(bus_server, "TOPIC_POLICIES", {"keepA": "drop_oldest"})
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    for i in range(3):
+        assert client.post("/publish", json={"topic": "keepA", "data": {"n": i}}, headers=headers).status_code == 200
+    big = client.post("/publish", json={"topic": "keepA", "data": {"x": "y" * 100}}, headers=headers)
+    assert big.status_code == 429
+    r = client.get("/get", params={"topic": "keepA", "max": 5, "wait": 0}, headers=headers)
+    assert r.json() == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert client.get("/stats", headers=headers).json()["topics"]["keepA"]["dropped"] == 0
+
+
+def test_shard_refuses_foreign_topics(monkeypatch):
+    """A shard answers 421 for topics the hash ring gives to another shard."""
+    shards = "http://127.0.0.1:7088,http://127.0.0.1:7089"
+    monkeypatch.setattr(bus_server, "SHARDS", shards)
+    monkeypatch.setattr(bus_server, "SHARD", "http://127.0.0.1:7088")
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    client = TestClient(bus_server.app)
+    headers = {"Authorization": "Bearer secret"}
+    topics = [f"shard-{i}" for i in range(20)]
+    mine = [t for t in topics if bus_server.url_for(shards, t) == bus_server.SHARD]
+    theirs = [t for t in topics if t not in mine]
+    assert mine and theirs
+    assert client.post("/publish", json={"topic": mine[0], "data": {}}, headers=headers).status_code == 200
+    assert client.post("/publish", json={"topic": theirs[0], "data": {}}, headers=headers).status_code == 421
+    r = client.post("/publish_batch", json={"topics": [mine[0], theirs[0]], "data": {}}, headers=headers)
+    assert r.status_code == 421
+    assert client.get("/get", params={"topic": theirs[0], "max": 1, "wait": 0}, headers=headers).status_code == 421
+    assert client.get("/get", params={"topic": mine[0], "max": 5, "wait": 0}, headers=headers).json() == [{}]
+
+
+def test_priority_lanes_ttl_and_queue_age(tmp_path, monkeypatch):
+    """Higher lanes are served first, expired messages are skipped, and both survive a restart."""
+    monkeypatch.setenv("BUS_TOKEN", "secret")
+    monkeypatch.setenv("BUS_LOG_DIR", str(tmp_path))
+    headers = {"Authorization": "Bearer secret"}
+
+    def publish(client, n, **options):
+        r = client.post("/publish", json={"topic": "lanes", "data": {"n": n}, **options}, headers=headers)
+        assert r.status_code == 200
+
+    with TestClient(bus_server.app) as client:
+        publish(client, 0)
+        publish(client, 1, ttl=0.05)
+        publish(client, 2, priority=7)
+        publish(client, 3, priority=3, ttl=600)
+        bad = client.post("/publish", json={"topic": "lanes", "data": {}, "priority": 10}, headers=headers)
+        assert bad.status_code == 422
+        r = client.get("/get", params={"topic": "lanes", "max": 1, "wait": 0}, headers=headers)
+        assert r.json() == [{"n": 2}]
+    bus_server.queues.clear()
+    time.sleep(0.1)
+    with TestClient(bus_server.app) as client:
+        r = client.get("/get", params={"topic": "lanes", "max": 10, "wait": 0}, headers=headers)
+        assert r.json() == [{"n": 3}, {"n": 0}]
+        stats = client.get("/stats", headers=headers).json()["topics"]["lanes"]
+        assert stats["expired"] == 1
+        assert set(stats["lanes"]) == {"0", "3"}
+        assert stats["lanes"]["3"]["delivered"] == 1 and stats["lanes"]["3"]["depth"] == 0
+        r = client.get("/offsets", params={"topic": "lanes", "group": "bus"}, headers=headers)
+        assert r.json()["offset"] == 4
@@ -0,0 +1,24 @@
+from bus_shard import HashRing, split, url_for
+
+SHARDS = "http://bus:7088,http://bus:7089,http://bus:7090"
+
+
+def test_ring_is_balanced_and_stable():
+    """Topics spread over every shard, and a new shard moves only its share."""
+    topics = [f"topic-{i}" for i in range(3000)]
+    three = HashRing(["a", "b", "c"])
+    owners = {t: three.node(t) for t in topics}
+    counts = {n: list(owners.values()).count(n) for n in "abc"}
+    assert min(counts.values()) > 700
+    four = HashRing(["a", "b", "c", "d"])
+    moved = [t for t in topics if four.node(t) != owners[t]]
+    assert all(four.node(t) == "d" for t in moved)
+    assert len(moved) < 1200
+
+
+def test_url_for_single_url_and_dead_letters():
+    assert url_for("http://bus:7088/", "CFO") == "http://bus:7088"
+    assert url_for(SHARDS, "CFO.dlq") == url_for(SHARDS, "CFO")
+    assert url_for(SHARDS, "CFO") == url_for(SHARDS.replace(",", ", "), "CFO")
+    groups = split(SHARDS, ["CFO", "CTO", "CFO.dlq"])
+    assert sorted(i for members in groups.values() for i, _ in members) == [0, 1, 2]
@@ -0,0 +1,74 @@
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import quote
+
+import bus_client
+import bus_server
+import bus_transport
+from bus_client import BusClient
+
+
+def test_local_transport_runs_the_bus_in_process(monkeypatch):
+    """local:// publishes, leases and acks through bus_server without HTTP."""
+    monkeypatch.setenv("BUS_LOG_DIR", "")
+    monkeypatch.setattr(bus_server, "add_entries", lambda rows: None)
+    local = bus_transport.LocalTransport()
+    monkeypatch.setattr(bus_client, "transport_for", lambda url: local)
+    assert bus_client.publish("local://", "local-CFO", {"n": 1}).json() == {"status": "ok"}
+    r = bus_client.publish_batch("local://", topics=["local-CFO", "local-CTO"], data={"n": 2})
+    assert [res["status"] for res in r.json()["results"]] == ["ok", "ok"]
+
+    received = []
+    client = BusClient("local://", "local-CFO", received.append, wait=0, stream=True)
+    assert client.stream is False
+    batch = client.poll()
+    assert [e["data"] for e in batch] == [{"n": 1}, {"n": 2}]
+    r = local.request("post", "local:///ack", json={"topic": "local-CFO", "ids": [e["id"] for e in batch]})
+    assert r.json() == {"acked": 2, "nacked": 0}
+    assert local.request("get", "local:///get", params={"topic": "local-CFO", "wait": 0}).status_code == 204
+    assert local.request("post", "local:///publish", json={"topic": "x"}).status_code == 422
+    bus_server.audit.flush()
+
+
+def test_unix_transport_reuses_one_connection(tmp_path):
+    """http+unix:// speaks HTTP/1.1 over the socket and keeps it alive."""
+    seen = []
+    connections = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            connections.append(1)
+            super().setup()
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            seen.append((self.path, self.headers["Authorization"], body))
+            out = json.dumps({"status": "ok"}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, *args):
+            pass
+
+    path = str(tmp_path / "bus.sock")
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http+unix://{quote(path, safe='')}"
+        for n in range(3):
+            r = bus_client.publish(url, "CFO", {"n": n}, token="secret")
+            assert r.ok and r.json() == {"status": "ok"}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert seen[0] == ("/publish", "Bearer secret", {"topic": "CFO", "data": {"n": 0}})
+    assert len(seen) == 3 and len(connections) == 1
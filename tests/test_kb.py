@@ -1,6 +1,13 @@
+import asyncio
 import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
 
+import pytest
+
 import kb
 
 
@@ -18,3 +25,333 @@ def test_kb_entry_logging(tmp_path):
     first_id = last_entries[0]["id"]
     entry = kb.get(first_id)
     assert entry["id"] == first_id
+
+
+def test_kb_connection_pool_reuses_migrated_connection(tmp_path, monkeypatch):
+    """Each thread keeps one prepared connection per database file."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    conn = kb._connect()
+    assert kb._connect() is conn
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(kb.MIGRATIONS)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "other.db")
+    assert kb._connect() is not conn
+    kb.close()
+
+
+def test_kb_write_behind_flush(tmp_path, monkeypatch):
+    """Queued entries are committed in groups and on flush."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.enable_write_behind(interval_ms=10_000, max_batch=1000)
+    try:
+        for i in range(25):
+            kb.add_entry(kind="note", text=f"queued {i}")
+        assert kb.write_behind_stats()["queue_depth"] == 25
+        assert kb.flush() == 25
+        stats = kb.write_behind_stats()
+        assert stats["queue_depth"] == 0 and stats["flushes"] == 1
+        assert len(kb.last(100)) == 25
+        kb.add_entry(kind="note", text="pending at shutdown")
+    finally:
+        kb.disable_write_behind()
+    assert len(kb.last(100)) == 26
+    kb.close()
+
+
+def test_kb_query_uses_json_columns(tmp_path, monkeypatch):
+    """Entries are stored as JSON and filtered on generated columns."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="chat", role="CFO", sender="ana", message="budget")
+    kb.add_entry(kind="chat", role="CTO", sender="ana", message="deploy")
+    kb.add_entry(kind="bus_message", topic="CFO", payload={"text": "invoice"})
+    assert json.loads(kb.last(1)[0]["data"])["payload"] == {"text": "invoice"}
+    assert [json.loads(r["data"])["message"] for r in kb.query(kind="chat", role="CFO")] == ["budget"]
+    assert len(kb.query(sender="ana")) == 2
+    assert len(kb.query(topic="CFO", since="2000-01-01 00:00:00")) == 1
+    assert kb.query(kind="chat", until="2000-01-01 00:00:00") == []
+    plan = kb._connect().execute("EXPLAIN QUERY PLAN SELECT id FROM entries WHERE role = 'CFO'").fetchall()
+    assert any("idx_entries_role" in str(step) for step in plan)
+    kb.close()
+
+
+def test_kb_migrates_legacy_repr_rows(tmp_path, monkeypatch):
+    """Rows written as Python reprs are rewritten as JSON and stay searchable."""
+    path = tmp_path / "kb.db"
+    legacy = sqlite3.connect(path)
+    for stmt in kb.MIGRATIONS[0]:
+        legacy.execute(stmt)
+    legacy.execute(
+        "INSERT INTO entries(kind,data) VALUES(?,?)",
+        ("chat", str({"kind": "chat", "role": "CFO", "message": "legacy hello"})),
+    )
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setattr(kb, "DB_PATH", path)
+    (row,) = kb.query(role="CFO")
+    assert json.loads(row["data"])["message"] == "legacy hello"
+    assert [r["id"] for r in kb.search("legacy")] == [row["id"]]
+    kb._connect().execute("INSERT INTO entries_fts(entries_fts) VALUES('integrity-check')")
+    kb.close()
+
+
+def test_kb_search_ranked_pages_and_prune(tmp_path, monkeypatch):
+    """Search is bm25-ranked, bounded, pageable and consistent after deletes."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="memo", text="invoice")
+    for i in range(5):
+        kb.add_entry(kind="bus_message", text=f"invoice overdue reminder number {i} for the finance team")
+    kb.add_entry(kind="note", text="nothing to see")
+    first = kb.search("invoice", limit=2)
+    assert len(first) == 2 and first[0]["kind"] == "memo"
+    assert "**invoice**" in first[0]["snippet"]
+    assert [r["rank"] for r in first] == sorted(r["rank"] for r in first)
+    rest = kb.search("invoice", limit=10, after=(first[-1]["rank"], first[-1]["id"]))
+    assert len(rest) == 4 and not {r["id"] for r in rest} & {r["id"] for r in first}
+    assert [r["id"] for r in kb.search("invoice", limit=10, offset=2)] == [r["id"] for r in rest]
+    assert {r["kind"] for r in kb.search("invoice", kinds=["bus_message"])} == {"bus_message"}
+    assert kb.prune("9999-01-01 00:00:00", kinds=["bus_message"]) == 5
+    assert [r["kind"] for r in kb.search("invoice")] == ["memo"]
+    kb._connect().execute("INSERT INTO entries_fts(entries_fts) VALUES('integrity-check')")
+    kb.close()
+
+
+def test_kb_ingest_many_dedupes_and_uses_workers(tmp_path, monkeypatch):
+    """Folders and texts are chunked in a pool and chunk texts stored once."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    docs = tmp_path / "docs"
+    (docs / "sub").mkdir(parents=True)
+    (docs / "a.md").write_text("Policy memo on travel budgets.", encoding="utf-8")
+    (docs / "sub" / "b.txt").write_text("Policy memo on travel budgets.", encoding="utf-8")
+    (docs / "skip.bin").write_text("ignored", encoding="utf-8")
+    seen = []
+    stats = kb.ingest_many([docs, "Hiring plan for the second half."], workers=2, progress=seen.append)
+    assert stats["documents"] == 3 and stats["chunks"] == 3
+    assert stats["stored"] == 2 and stats["duplicates"] == 1
+    assert [s["documents"] for s in seen] == [1, 2, 3]
+    sources = {json.loads(r["data"])["meta"].get("source") for r in kb.query(kind="kb_chunk")}
+    assert str(docs / "a.md") in sources and None in sources
+    kb.close()
+
+
+def test_kb_chunks_are_content_addressed(tmp_path, monkeypatch):
+    """Re-ingesting unchanged text stores nothing new and stays searchable."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    text = " ".join(f"Clause {i} of the expense policy memo." for i in range(400))
+    first = kb.ingest_many([text], meta={"doc": "policy"})
+    again = kb.ingest_many([text], meta={"doc": "policy"})
+    assert first["chunks"] > 1 and again["chunks"] == 0 and again["skipped"] == first["chunks"]
+    conn = kb._connect()
+    assert conn.execute("SELECT count(*) FROM chunks").fetchone()[0] == first["stored"]
+    hits = kb.search("expense", kinds=["kb_chunk"], limit=100)
+    assert len(hits) == first["chunks"] and "**expense**" in hits[0]["snippet"]
+    assert "Clause" in json.loads(kb.get(hits[0]["id"])["data"])["text"]
+    assert kb.prune("9999-01-01 00:00:00", kinds=["kb_chunk"]) == first["chunks"]
+    assert conn.execute("SELECT count(*) FROM chunks").fetchone()[0] == 0
+    conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES('integrity-check')")
+    kb.close()
+
+
+def test_kb_migrates_inline_chunk_texts(tmp_path, monkeypatch):
+    """Chunks stored inline before the chunk store are moved into it."""
+    path = tmp_path / "kb.db"
+    legacy = sqlite3.connect(path)
+    for step in kb.MIGRATIONS[:6]:
+        for stmt in step if isinstance(step, list) else []:
+            legacy.execute(stmt)
+    legacy.execute("DELETE FROM chunks")
+    legacy.execute("PRAGMA user_version=6")
+    legacy.execute(
+        "INSERT INTO entries(kind,data) VALUES('kb_chunk', ?)",
+        (json.dumps({"kind": "kb_chunk", "chunk_index": 0, "text": "old inline chunk", "meta": {}}),),
+    )
+    legacy.commit()
+    legacy.close()
+    monkeypatch.setattr(kb, "DB_PATH", path)
+    (row,) = kb.last(1)
+    assert json.loads(row["data"])["text"] == "old inline chunk"
+    assert "text" not in json.loads(kb._connect().execute("SELECT data FROM entries").fetchone()[0])
+    assert [r["id"] for r in kb.search("inline")] == [row["id"]]
+    kb.close()
+
+
+def test_kb_archives_months_and_fans_out(tmp_path, monkeypatch):
+    """Finished months move to compressed segments that queries still reach."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    for month in ("2025-01", "2025-02"):
+        for i in range(3):
+            kb.add_entry(kind="bus_message", topic="CFO", text=f"invoice {month} #{i}")
+        kb._connect().execute("UPDATE entries SET ts = ? WHERE ts > '2026-01-01 00:00:00'", (f"{month}-15 12:00:00",))
+    kb.ingest_text("Archived months keep knowledge chunks hot.")
+    kb._connect().execute("UPDATE entries SET ts = '2025-01-10 00:00:00' WHERE kind = 'kb_chunk'")
+    kb._connect().commit()
+    kb.add_entry(kind="bus_message", topic="CFO", text="invoice current")
+    old_ids = [r["id"] for r in kb.query(topic="CFO", until="2026-01-01 00:00:00")]
+
+    parts = kb.archive()
+    assert [p["month"] for p in parts] == ["2025-01", "2025-02"] and all(p["rows"] == 3 for p in parts)
+    assert sorted(f.name.split(".")[0] for f in (tmp_path / "kb_archive").glob("*.db.*")) == ["2025-01", "2025-02"]
+    hot = kb._connect().execute("SELECT kind, count(*) FROM entries GROUP BY kind").fetchall()
+    assert dict(hot) == {"bus_message": 1, "kb_chunk": 1}
+    assert kb.archive() == []
+
+    assert len(kb.search("invoice")) == 1
+    assert len(kb.search("invoice", since="2025-02-01 00:00:00")) == 4
+    assert len(kb.query(topic="CFO", limit=100)) == 7
+    assert [r["id"] for r in kb.query(topic="CFO", since="2025-02-01", until="2025-03-01")] == old_ids[:3]
+    assert kb.get(old_ids[-1])["id"] == old_ids[-1]
+    assert len(kb.last(100)) == 8
+
+    assert kb.drop_partitions("2025-02-01 00:00:00") == ["2025-01"]
+    assert not list((tmp_path / "kb_archive").glob("2025-01.*"))
+    assert len(kb.query(topic="CFO", limit=100)) == 4
+    kb.close()
+
+
+def test_kb_ingest_text_never_reads_files(tmp_path, monkeypatch):
+    """Raw text that happens to name a file or folder is stored as text."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "notes").mkdir()
+    (tmp_path / "notes" / "secret.md").write_text("Private memo.", encoding="utf-8")
+    kb.ingest_text("notes")
+    assert kb.ingest_many(["notes"])["bytes"] == len("notes")
+    assert kb.ingest_many([Path("notes")])["documents"] == 1
+    sources = [json.loads(r["data"])["meta"].get("source") for r in kb.query(kind="kb_chunk")]
+    assert sources == [str(Path("notes") / "secret.md"), None]
+    kb.close()
+
+
+def test_kb_last_merges_old_hot_chunks_by_id(tmp_path, monkeypatch):
+    """A hot kb_chunk older than archived rows does not jump ahead of them."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="kb_chunk", text="alpha", chunk_index=0)
+    for i in range(3):
+        kb.add_entry(kind="chat", message=f"m{i}")
+    kb._connect().execute("UPDATE entries SET ts = '2025-01-15 12:00:00'")
+    kb._connect().commit()
+    kb.archive()
+    kb.add_entry(kind="chat", message="live")
+    assert [r["id"] for r in kb.last(3)] == [5, 4, 3]
+    assert [r["id"] for r in kb.query(limit=10)] == [5, 4, 3, 2, 1]
+    assert kb.last(0) == [] and kb.query(limit=0) == []
+    kb.close()
+
+
+def test_kb_tail_follows_new_rows(tmp_path, monkeypatch):
+    """tail() resumes from a cursor and wakes up for new local writes."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="chat", message="before")
+    kb.add_entry(kind="note", text="skipped kind")
+    feed = kb.tail(0, kinds=["chat"], heartbeat=0.2)
+    assert json.loads(next(feed)["data"])["message"] == "before"
+
+    def writer():
+        time.sleep(0.1)
+        kb.add_entry(kind="note", text="ignored")
+        kb.add_entry(kind="chat", message="after")
+
+    t = threading.Thread(target=writer)
+    t.start()
+    start = time.monotonic()
+    row = next(r for r in feed if r is not None)
+    t.join()
+    assert json.loads(row["data"])["message"] == "after"
+    assert time.monotonic() - start < 1
+    assert next(feed) is None
+    live = kb.tail(kinds=["note"], heartbeat=0.1)
+    assert next(live) is None
+    kb.close()
+
+
+def test_kb_atail_follows_without_holding_a_thread(tmp_path, monkeypatch):
+    """atail() yields new rows and heartbeats from short reader-pool steps."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="chat", message="before")
+
+    async def scenario():
+        feed = kb.atail(0, kinds=["chat"], heartbeat=0.2)
+        first = await feed.__anext__()
+        later = asyncio.get_running_loop().call_later(0.1, lambda: kb.add_entry(kind="chat", message="after"))
+        start = time.monotonic()
+        second = await feed.__anext__()
+        later.cancel()
+        assert time.monotonic() - start < 1
+        assert await feed.__anext__() is None
+        await feed.aclose()
+        return [json.loads(r["data"])["message"] for r in (first, second)]
+
+    assert asyncio.run(scenario()) == ["before", "after"]
+    kb.close()
+
+
+def test_kb_async_facade(tmp_path, monkeypatch):
+    """Async wrappers run KB calls off the event loop."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+
+    async def scenario():
+        await asyncio.gather(*(kb.aadd_entry(kind="chat", message=f"async {i}") for i in range(20)))
+        rows = await kb.alast(50)
+        hits = await kb.asearch("async", limit=5)
+        chats = await kb.aquery(kind="chat", limit=100)
+        return rows, hits, chats, await kb.aget(rows[0]["id"])
+
+    rows, hits, chats, entry = asyncio.run(scenario())
+    assert len(rows) == 20 and len(hits) == 5 and len(chats) == 20
+    assert entry["id"] == rows[0]["id"]
+    kb.close()
+
+
+def test_kb_read_cache_validates_against_writes(tmp_path, monkeypatch):
+    """Repeated reads hit the cache until rows are added or removed."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.read_cache.clear()
+    kb.add_entry(kind="chat", message="cached invoice")
+    first = kb.search("invoice")
+    first[0]["kind"] = "mutated"
+    assert kb.search("  invoice ") == kb.search("invoice") != first
+    assert kb.cache_stats()["hits"] == 2
+    kb.add_entry(kind="chat", message="second invoice")
+    assert len(kb.search("invoice")) == 2
+    kb.prune(datetime.now() + timedelta(days=1))
+    assert kb.search("invoice") == []
+    assert kb.cache_stats()["misses"] == 3
+    kb.close()
+
+
+def test_kb_read_cache_reads_kind_iterators_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.read_cache.clear()
+    kb.add_entry(kind="chat", message="cached invoice")
+    assert len(kb.search("invoice", kinds=(k for k in ["chat"]))) == 1
+    assert len(kb.search("invoice", kinds=["chat"])) == 1
+    kb.close()
+
+
+def test_kb_snapshot_backup_and_pinned_reader(tmp_path, monkeypatch):
+    """Online backups are complete copies; snapshot readers ignore later writes."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    for i in range(50):
+        kb.add_entry(kind="note", message=f"row {i}")
+    steps = []
+    dest = kb.snapshot(tmp_path / "copy.db", progress=lambda status, remaining, total: steps.append(remaining))
+    assert steps == [0] and not (tmp_path / "copy.db.part").exists()
+    with kb.snapshot_reader(dest) as snap:
+        assert snap.execute("SELECT count(*) FROM entries").fetchone()[0] == 50
+    with kb.snapshot_reader() as snap:
+        kb.add_entry(kind="note", message="late")
+        assert snap.execute("SELECT count(*) FROM entries").fetchone()[0] == 50
+        with pytest.raises(sqlite3.OperationalError):
+            snap.execute("DELETE FROM entries")
+    assert len(kb.last(100)) == 51
+    kb.close()
+
+
+def test_kb_add_entries_writes_one_transaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    calls = []
+    real = kb._insert_rows
+    monkeypatch.setattr(kb, "_insert_rows", lambda rows: calls.append(len(rows)) or real(rows))
+    asyncio.run(kb.aadd_entries({"kind": "bus_message", "topic": t} for t in ("CFO", "COO", "CEO")))
+    assert calls == [3]
+    assert [r["id"] for r in kb.query(kind="bus_message")] == [3, 2, 1]
+    kb.close()
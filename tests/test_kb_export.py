@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+import kb
+import kb_export
+
+
+def _ndjson(path):
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_export_ndjson_is_incremental(tmp_path, monkeypatch):
+    """Rows are split per kind, archived months included, and never exported twice."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="bus_message", topic="CFO", payload={"n": 1})
+    kb._connect().execute("UPDATE entries SET ts = '2025-01-15 12:00:00'")
+    kb._connect().commit()
+    kb.archive()
+    kb.add_entry(kind="chat", role="CEO", message="hello")
+    kb.add_entry(kind="policy", decision="hire", verdict="acceptable")
+    out = tmp_path / "exports"
+
+    stats = kb_export.export(out, fmt="ndjson", batch=1)
+    assert stats["rows"] == 3 and stats["kinds"] == {"bus_message": 1, "chat": 1, "policy": 1}
+    (bus_file,) = (out / "kind=bus_message").glob("*.ndjson.gz")
+    assert _ndjson(bus_file) == [{"id": 1, "ts": "2025-01-15 12:00:00", "topic": "CFO", "payload": '{"n":1}'}]
+    state = json.loads((out / "_state.json").read_text())
+    assert state["last_id"] == stats["last_id"] and state["schemas"]["policy"]["verdict"] == "string"
+
+    assert kb_export.export(out, fmt="ndjson")["rows"] == 0
+    kb.add_entry(kind="chat", role="CFO", message="again")
+    stats = kb_export.export(out, fmt="ndjson")
+    assert stats["kinds"] == {"chat": 1} and len(list((out / "kind=chat").glob("*.ndjson.gz"))) == 2
+    kb.close()
+
+
+def test_export_parquet_rolls_files_on_schema_change(tmp_path, monkeypatch):
+    pq = pytest.importorskip("pyarrow.parquet")
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    for i in range(4):
+        kb.add_entry(kind="chat", role="CEO", message=f"m{i}", tokens=i)
+    kb.add_entry(kind="chat", role="CEO", message="late", model="llama3.1")
+    stats = kb_export.export(tmp_path / "exports", fmt="parquet", batch=4)
+    assert stats["rows"] == 5 and len(stats["files"]) == 2
+    first, second = (pq.read_table(path) for path in stats["files"])
+    assert first.column("tokens").to_pylist() == [0, 1, 2, 3]
+    assert "model" in second.column_names
+    kb.close()
+
+
+def test_export_merges_hot_chunks_with_archived_months(tmp_path, monkeypatch):
+    """kb_chunk rows stay hot below archived ids and are still exported, in id order."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.add_entry(kind="kb_chunk", text="alpha", chunk_index=0)
+    for i in range(3):
+        kb.add_entry(kind="chat", role="CEO", message=f"m{i}")
+    kb._connect().execute("UPDATE entries SET ts = '2025-01-15 12:00:00'")
+    kb._connect().commit()
+    kb.archive()
+    kb.add_entry(kind="chat", role="CFO", message="live")
+    stats = kb_export.export(tmp_path / "exports", fmt="ndjson", batch=2)
+    assert stats["kinds"] == {"kb_chunk": 1, "chat": 4} and stats["last_id"] == 5
+    (chat_file,) = (tmp_path / "exports" / "kind=chat").glob("*.ndjson.gz")
+    assert [row["id"] for row in _ndjson(chat_file)] == [2, 3, 4, 5]
+    kb.close()
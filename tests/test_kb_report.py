@@ -0,0 +1,51 @@
+import json
+import sys
+import types
+from datetime import datetime, timedelta
+
+# Provide a minimal Drive client before importing kb_report
+dummy_drive = types.ModuleType("integrations.drive_client")
+
+
+def upload_file(path: str, parent: str, name: str, creds=None):  # noqa: D401 - simple stub
+    return "file-id"
+
+
+dummy_drive.upload_file = upload_file  # type: ignore[attr-defined]
+sys.modules["integrations.drive_client"] = dummy_drive
+
+import kb  # noqa: E402
+import kb_report  # noqa: E402
+
+
+def test_weekly_report_dedupes_and_caches(tmp_path, monkeypatch):
+    """Rows appear once, under their first section; finished weeks are cached."""
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    monkeypatch.chdir(tmp_path)
+    kb.add_entry(kind="chat", role="CFO", sender="CPO", message="budget review")
+    kb.add_entry(kind="bus_message", topic="CPO", payload={"text": "roadmap"})
+    kb.add_entry(kind="policy", decision="hire", verdict="acceptable")
+    kb.add_entry(kind="note", text="unrelated")
+    week = datetime.utcnow().strftime("%Y-%W")
+    path = kb_report.build_report()
+    text = path.read_text(encoding="utf-8")
+    assert text.count("budget review") == 1 and text.count("roadmap") == 1
+    assert "## Finance (1)" in text and "## Technology (1)" in text and "## Marketing/Product (0)" in text
+    assert "## Policy/Admin (1)" in text and "unrelated" not in text
+    kb.add_entry(kind="chat", role="CTO", message="deploy")
+    assert kb_report.materialize(week)["Technology"] == 2
+
+    past = (datetime.utcnow() - timedelta(days=14)).strftime("%Y-%W")
+    start, _ = kb_report.week_window(past)
+    kb.add_entry(kind="memo", topic="ops", text="old memo")
+    kb._connect().execute("UPDATE entries SET ts = ? WHERE kind = 'memo'", (start,))
+    kb._connect().commit()
+    assert kb_report.materialize(past)["Policy/Admin"] == 1
+    kb.add_entry(kind="memo", topic="ops", text="late memo")
+    kb._connect().execute("UPDATE entries SET ts = ? WHERE data LIKE '%late memo%'", (start,))
+    kb._connect().commit()
+    assert kb_report.materialize(past)["Policy/Admin"] == 1
+    assert "late memo" not in kb_report.build_report(past).read_text(encoding="utf-8")
+    row = kb._connect().execute("SELECT complete, counts FROM report_weeks WHERE week = ?", (past,)).fetchone()
+    assert row[0] == 1 and json.loads(row[1])["Policy/Admin"] == 1
+    kb.close()
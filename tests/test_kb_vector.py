@@ -0,0 +1,69 @@
+import pytest
+
+import kb
+import kb_vector
+
+
+def _chunks():
+    topics = ["invoice payment overdue", "kubernetes deployment rollout", "hiring onboarding benefits"]
+    for i in range(60):
+        topic = topics[i % 3]
+        kb.add_entry(kind="kb_chunk", chunk_index=i, text=f"{topic} note {i}", meta={})
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_vector_search_finds_related_chunk(tmp_path, monkeypatch, use_numpy):
+    """Hashing embedder retrieves the chunk closest to the query."""
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(kb_vector, "np", None)
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    kb.ingest_text("Quarterly invoice payments are overdue for two clients.", meta={"src": "cfo"})
+    kb.ingest_text("The kubernetes rollout was paused after a failed deployment.", meta={"src": "cto"})
+    index = kb_vector.VectorIndex(kb_vector.HashingEmbedder())
+    (hit,) = kb_vector.search("overdue invoice", k=1, index=index)
+    assert "invoice" in hit["data"] and hit["score"] > 0
+    assert index.sync() == 0
+    kb.close()
+
+
+def test_ivf_index_matches_brute_force_and_tracks_deletes(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    _chunks()
+    embedder = kb_vector.HashingEmbedder()
+    brute = kb_vector.VectorIndex(embedder)
+    expected = brute.search("deployment rollout", k=5)
+    ivf = kb_vector.VectorIndex(embedder, ivf_threshold=10, nprobe=1000)
+    ivf.build()
+    assert ivf._meta()["ivf"]
+    assert [round(s, 5) for _, s in ivf.search("deployment rollout", k=5)] == [round(s, 5) for _, s in expected]
+    top_id = expected[0][0]
+    kb._connect().execute("DELETE FROM entries WHERE id = ?", (top_id,))
+    kb._connect().commit()
+    assert top_id not in [i for i, _ in ivf.search("deployment rollout", k=5)]
+    kb.close()
+
+
+def test_new_chunks_are_appended_until_the_delta_is_stale(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(kb, "DB_PATH", tmp_path / "kb.db")
+    _chunks()
+    index = kb_vector.VectorIndex(kb_vector.HashingEmbedder(), min_delta=3, rebuild_fraction=0)
+    index.search("invoice", k=1)
+    built = index._meta()
+    for text in ("quantum annealing schedule", "quantum error correction"):
+        kb.add_entry(kind="kb_chunk", chunk_index=0, text=text, meta={})
+        (hit_id, _), *_ = index.search("quantum", k=2)
+        assert "quantum" in kb.get(hit_id)["data"]
+    meta = index._meta()
+    assert meta["generation"] == built["generation"] and meta["delta"] == 2 and meta["count"] == 62
+    assert len(list(index.directory.glob("delta-*.npy"))) == 2
+    for i in range(2):
+        kb.add_entry(kind="kb_chunk", chunk_index=0, text=f"quantum note {i}", meta={})
+    assert len(index.search("quantum", k=10)) == 10
+    meta = index._meta()
+    assert meta["generation"] == built["generation"] + 1 and meta["delta"] == 0 and meta["count"] == 64
+    assert not list(index.directory.glob("delta-*.npy"))
+    kb.close()
@@ -0,0 +1,125 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+from urllib.parse import quote
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# Measure the transport, not the log or the KB audit trail.
+os.environ["BUS_LOG_DIR"] = ""
+os.environ["BUS_AUDIT"] = "drop"
+os.environ.setdefault("BUS_TOKEN", "bench")
+import bus_client  # noqa: E402
+from bus_transport import transport_for  # noqa: E402
+
+TRANSPORTS = ("http", "unix", "local")
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)  # noqa: E731
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(samples[-1], 3)}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(kind: str, tmp: str) -> tuple:
+    """Run ``bus_server.py`` in a subprocess; return ``(process, base_url)``."""
+    env = os.environ.copy()
+    if kind == "unix":
+        path = os.path.join(tmp, "bus.sock")
+        env["BUS_UDS"] = path
+        url = f"http+unix://{quote(path, safe='')}"
+    else:
+        port = _free_port()
+        env["BUS_PORT"] = str(port)
+        url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen([sys.executable, "bus_server.py"], cwd=ROOT, env=env, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            if transport_for(url).request("get", f"{url}/health", timeout=1).status_code == 200:
+                return proc, url
+        except OSError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError(f"bus_server did not come up for {kind}")
+
+
+def bench_transport(kind: str, messages: int, payload_bytes: int = 256) -> Dict[str, Any]:
+    """Per-message latency of one publish and of a publish followed by its ``/get``."""
+    data = {"sender": "bench", "text": "x" * payload_bytes}
+    topic = f"bench-{kind}"
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = None
+        if kind == "local":
+            url = "local://"
+        else:
+            proc, url = _start_server(kind, tmp)
+        try:
+            client = bus_client.BusClient(url, topic, lambda msg: None, lease=None, batch=1, wait=0)
+            for _ in range(min(100, messages)):  # warm up connections and code paths
+                bus_client.publish(url, topic, data)
+                client.poll()
+            publish, round_trip = [], []
+            for _ in range(messages):
+                start = time.perf_counter()
+                bus_client.publish(url, topic, data)
+                sent = time.perf_counter()
+                got = client.poll()
+                done = time.perf_counter()
+                assert got == [data], got
+                publish.append((sent - start) * 1000)
+                round_trip.append((done - start) * 1000)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=10)
+    return {
+        "transport": kind,
+        "messages": messages,
+        "payload_bytes": payload_bytes,
+        "publish": _percentiles(publish),
+        "round_trip": _percentiles(round_trip),
+        "messages_per_sec": round(messages / (sum(round_trip) / 1000), 1),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure bus latency per transport")
+    ap.add_argument("--messages", type=int, default=2000)
+    ap.add_argument("--payload", type=int, default=256, help="Message text size in bytes")
+    ap.add_argument("--transports", default=",".join(TRANSPORTS), help="Comma-separated subset of http,unix,local")
+    ap.add_argument("--out", default=None, help="Optional JSON output path")
+    args = ap.parse_args()
+
+    kinds: Sequence[str] = [k for k in args.transports.split(",") if k]
+    results = []
+    for kind in kinds:
+        r = bench_transport(kind, args.messages, args.payload)
+        results.append(r)
+        print(
+            f"[bench] {kind:>5}: publish p50 {r['publish']['p50_ms']} ms, p99 {r['publish']['p99_ms']} ms; "
+            f"round trip p50 {r['round_trip']['p50_ms']} ms, p99 {r['round_trip']['p99_ms']} ms "
+            f"({r['messages_per_sec']} msg/s)",
+            flush=True,
+        )
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[bench] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import kb  # noqa: E402
+
+
+def _legacy_add_entry(path: Path, **data: Any) -> None:
+    """Pre-pool write path: connect, set WAL and re-run DDL on every call."""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    schema = kb.MIGRATIONS[0]
+    if isinstance(schema, list):
+        for stmt in schema:
+            conn.execute(stmt)
+    conn.execute("INSERT INTO entries(kind,data) VALUES(?,?)", (data.get("kind"), str(data)))
+    conn.commit()
+    conn.close()
+
+
+def bench_add_entry(n: int, mode: str = "pooled") -> Dict[str, Any]:
+    """Write ``n`` entries with ``mode`` in (legacy, pooled, write_behind)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        kb.DB_PATH = Path(tmp) / "kb.db"
+        if mode == "write_behind":
+            kb.enable_write_behind()
+        start = time.perf_counter()
+        for i in range(n):
+            payload = {"kind": "bench", "topic": "CFO", "text": f"message {i}"}
+            if mode == "legacy":
+                _legacy_add_entry(kb.DB_PATH, **payload)
+            else:
+                kb.add_entry(**payload)
+        kb.flush()
+        elapsed = time.perf_counter() - start
+        stats = kb.write_behind_stats()
+        kb.disable_write_behind()
+        kb.close()
+    result: Dict[str, Any] = {
+        "mode": mode,
+        "entries": n,
+        "seconds": round(elapsed, 4),
+        "entries_per_sec": round(n / elapsed, 1),
+    }
+    if stats:
+        result["write_behind"] = stats
+    return result
+
+
+def bench_threads(n: int, threads: int) -> Dict[str, Any]:
+    """Write ``n`` entries split across ``threads`` writer threads."""
+    with tempfile.TemporaryDirectory() as tmp:
+        kb.DB_PATH = Path(tmp) / "kb.db"
+        kb._connect()
+
+        def writer(worker: int) -> None:
+            for i in range(n // threads):
+                kb.add_entry(kind="bench", topic=f"T{worker}", text=f"message {i}")
+
+        pool = [threading.Thread(target=writer, args=(w,)) for w in range(threads)]
+        start = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - start
+        kb.close()
+    written = n // threads * threads
+    return {
+        "threads": threads,
+        "entries": written,
+        "seconds": round(elapsed, 4),
+        "entries_per_sec": round(written / elapsed, 1),
+    }
+
+
+WORDS = (
+    "invoice budget roadmap hiring policy launch churn revenue forecast audit vendor contract "
+    "security incident deploy latency backlog pricing campaign payroll compliance"
+).split()
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)  # noqa: E731
+    return {"p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(samples[-1], 3)}
+
+
+def _db_bytes() -> int:
+    return sum(os.path.getsize(p) for p in kb.DB_PATH.parent.glob(kb.DB_PATH.name + "*"))
+
+
+def bench_search(sizes: Sequence[int], queries: int = 200, seed: int = 0) -> List[Dict[str, Any]]:
+    """``search`` latency percentiles and database size at each row count.
+
+    One database grows through ``sizes``; synthetic chat rows draw eight
+    words from a small vocabulary so every query has many matches. The read
+    cache is off so each call reaches SQLite.
+    """
+    rng = random.Random(seed)
+    results = []
+    capacity = kb.read_cache.capacity
+    kb.read_cache.capacity = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        kb.DB_PATH = Path(tmp) / "kb.db"
+        rows = 0
+        for size in sorted(sizes):
+            added = size - rows
+            fill_start = time.perf_counter()
+            while rows < size:
+                batch = min(5000, size - rows)
+                kb._insert_rows(
+                    [
+                        kb._row({"kind": "chat", "role": rng.choice(("CEO", "CFO", "CTO")), "message": " ".join(rng.choices(WORDS, k=8))})
+                        for _ in range(batch)
+                    ]
+                )
+                rows += batch
+            fill = time.perf_counter() - fill_start
+            kb._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            timings: Dict[str, List[float]] = {"single": [], "pair": [], "page2": []}
+            for _ in range(queries):
+                a, b = rng.sample(WORDS, 2)
+                for label, call in (
+                    ("single", lambda: kb.search(a, limit=20)),
+                    ("pair", lambda: kb.search(f"{a} {b}", limit=20)),
+                    ("page2", lambda: kb.search(a, limit=20, offset=20)),
+                ):
+                    start = time.perf_counter()
+                    call()
+                    timings[label].append((time.perf_counter() - start) * 1000)
+            size_bytes = _db_bytes()
+            results.append(
+                {
+                    "rows": size,
+                    "fill_rows_per_sec": round(added / fill, 1) if added else None,
+                    "db_bytes": size_bytes,
+                    "bytes_per_row": round(size_bytes / size, 1),
+                    "search": {label: _percentiles(t) for label, t in timings.items()},
+                }
+            )
+        kb.close()
+    kb.read_cache.capacity = capacity
+    return results
+
+
+def bench_ingest(documents: int, doc_kb: int, workers: int = 1, seed: int = 0) -> Dict[str, Any]:
+    """``ingest_many`` throughput on large synthetic documents."""
+    rng = random.Random(seed)
+    texts = []
+    for d in range(documents):
+        paragraphs: List[str] = []
+        size = 0
+        while size < doc_kb * 1024:
+            para = " ".join(rng.choices(WORDS, k=rng.randint(40, 120))) + f" doc{d}p{len(paragraphs)}."
+            paragraphs.append(para)
+            size += len(para) + 2
+        texts.append("\n\n".join(paragraphs))
+    with tempfile.TemporaryDirectory() as tmp:
+        kb.DB_PATH = Path(tmp) / "kb.db"
+        start = time.perf_counter()
+        # workers=1 is exactly the ingest_text path, one document at a time.
+        stats = kb.ingest_many(texts, meta={"source": "bench"}, workers=workers)
+        elapsed = time.perf_counter() - start
+        size_bytes = _db_bytes()
+        kb.close()
+    total = sum(len(t.encode("utf-8")) for t in texts)
+    return {
+        "documents": documents,
+        "workers": workers,
+        "bytes": total,
+        "chunks": stats["chunks"],
+        "stored": stats["stored"],
+        "seconds": round(elapsed, 4),
+        "mb_per_sec": round(total / elapsed / 1e6, 3),
+        "chunks_per_sec": round(stats["chunks"] / elapsed, 1),
+        "db_bytes": size_bytes,
+    }
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent.parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(entries: int, threads: Sequence[int], sizes: Sequence[int], queries: int, documents: int, doc_kb: int) -> Dict[str, Any]:
+    """Every benchmark, as one JSON-ready document for comparing commits."""
+    suite: Dict[str, Any] = {"environment": _environment()}
+    print("[bench] add_entry ...", flush=True)
+    suite["add_entry"] = [bench_add_entry(entries, mode) for mode in ("pooled", "write_behind")]
+    suite["add_entry_threads"] = [bench_threads(entries, t) for t in threads]
+    print("[bench] search ...", flush=True)
+    suite["search"] = bench_search(sizes, queries)
+    print("[bench] ingest ...", flush=True)
+    suite["ingest"] = [bench_ingest(documents, doc_kb, w) for w in sorted({1, os.cpu_count() or 1})]
+    return suite
+
+
+def bench_event_loop(publishes: int, concurrency: int, mode: str) -> Dict[str, Any]:
+    """Event-loop lag while ``concurrency`` tasks log ``publishes`` entries.
+
+    ``blocking`` calls ``kb.add_entry`` inside the coroutine, as the servers
+    did before; ``async`` awaits ``kb.aadd_entry``. A ticker task sleeping
+    1 ms records how late it wakes up.
+    """
+
+    async def scenario() -> Dict[str, Any]:
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            loop = asyncio.get_running_loop()
+            while not done.is_set():
+                start = loop.time()
+                await asyncio.sleep(0.001)
+                lags.append((loop.time() - start - 0.001) * 1000)
+
+        async def publisher(worker: int):
+            for i in range(publishes // concurrency):
+                payload = {"kind": "bus_message", "topic": f"T{worker}", "payload": {"n": i}}
+                if mode == "async":
+                    await kb.aadd_entry(**payload)
+                else:
+                    kb.add_entry(**payload)
+                    await asyncio.sleep(0)
+
+        tick = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*(publisher(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await tick
+        lags.sort()
+        return {
+            "mode": mode,
+            "publishes": publishes,
+            "concurrency": concurrency,
+            "seconds": round(elapsed, 4),
+            "loop_lag_p50_ms": round(lags[len(lags) // 2], 3) if lags else None,
+            "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99)], 3) if lags else None,
+            "loop_lag_max_ms": round(lags[-1], 3) if lags else None,
+            "ticks": len(lags),
+        }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kb.DB_PATH = Path(tmp) / "kb.db"
+        result = asyncio.run(scenario())
+        kb.close()
+    return result
+
+
+def _ints(text: str) -> List[int]:
+    return [int(float(x)) for x in text.split(",") if x]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure kb.add_entry throughput")
+    ap.add_argument("--entries", type=int, default=2000)
+    ap.add_argument("--out", default=None, help="Optional JSON output path")
+    ap.add_argument("--loop", action="store_true", help="Measure event-loop lag under concurrent publishes")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--suite", action="store_true", help="Run the full write/search/ingest/size suite")
+    ap.add_argument("--threads", type=_ints, default=[1, 4, 16], help="Writer thread counts, e.g. 1,4,16")
+    ap.add_argument("--sizes", type=_ints, default=[10_000, 100_000, 1_000_000], help="Row counts for search, e.g. 1e4,1e5")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--documents", type=int, default=8)
+    ap.add_argument("--doc-kb", type=int, default=256, help="Synthetic document size in KiB")
+    args = ap.parse_args()
+
+    if args.suite:
+        results: Any = run_suite(args.entries, args.threads, args.sizes, args.queries, args.documents, args.doc_kb)
+        for r in results["add_entry"] + results["add_entry_threads"]:
+            label = r.get("mode") or f"{r['threads']} threads"
+            print(f"[bench] add_entry {label:>12}: {r['entries_per_sec']:>10.1f} entries/sec", flush=True)
+        for r in results["search"]:
+            s = r["search"]["single"]
+            print(
+                f"[bench] search @{r['rows']:>9}: p50 {s['p50_ms']} ms, p99 {s['p99_ms']} ms, "
+                f"{r['db_bytes'] / 1e6:.1f} MB ({r['bytes_per_row']} B/row)",
+                flush=True,
+            )
+        for r in results["ingest"]:
+            print(f"[bench] ingest {r['workers']} workers: {r['mb_per_sec']} MB/s, {r['chunks_per_sec']} chunks/sec", flush=True)
+    elif args.loop:
+        results = [bench_event_loop(args.entries, args.concurrency, mode) for mode in ("blocking", "async")]
+        for r in results:
+            print(
+                f"[bench] {r['mode']:>8}: loop lag p50 {r['loop_lag_p50_ms']} ms, "
+                f"p99 {r['loop_lag_p99_ms']} ms, max {r['loop_lag_max_ms']} ms ({r['ticks']} ticks)",
+                flush=True,
+            )
+    else:
+        results = [bench_add_entry(args.entries, mode) for mode in ("legacy", "pooled", "write_behind")]
+        base = results[0]["entries_per_sec"]
+        for r in results:
+            speedup = r["entries_per_sec"] / base
+            print(f"[bench] {r['mode']:>12}: {r['entries_per_sec']:>10.1f} entries/sec ({speedup:.1f}x)", flush=True)
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"[bench] wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
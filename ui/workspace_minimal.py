@@ -1,10 +1,10 @@
-from typing import Callable
+from typing import Callable, Optional
 from rich.console import Console
 from ui_texts import load_texts
 
 
 def main(
-    route: Callable[[str, str, str], None],
+    route: Callable[[str, str, str], Optional[str]],
     check_ceo: Callable[[str], str],
     lang: str = "en",
 ) -> None:
@@ -28,7 +28,9 @@ def main(
             # Format: chat agent::message
             _, rest = line.split(" ", 1)
             agent, msg = rest.split("::", 1)
-            route("admin", agent.strip(), msg.strip())
+            status = route("admin", agent.strip(), msg.strip())
+            if status not in (None, "ok"):
+                console.print(f"bus: {status}")
         elif line.startswith("check "):
             # Format: check CEO::summary
             _, rest = line.split(" ", 1)